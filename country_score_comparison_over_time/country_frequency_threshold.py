@@ -11,6 +11,10 @@ import os
 import sys
 import pandas as pd
 import numpy as np
+# The per-sequence scores reader of the scoring scripts (parquet, tsv and normalized layouts)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "software"))
+from sequence_scores import read_sequence_scores
+from location_parser import REPOSITORY_LOCATION_CACHE, location_columns
 
 output = sys.argv[1]
 monthlyComparison_dir = sys.argv[2]
@@ -26,18 +30,12 @@ for directory in os.listdir(monthlyComparison_dir):
     # Parsing through the month directories to find countries that had at least 1% of sequences
     print("Directory: ", directory)
     if "-20" in str(directory):
-        antigenic_score_df = pd.read_csv(monthlyComparison_dir+directory+"/antigenic_scores_all.csv", sep = '\t', usecols = ["Location"])
+        antigenic_score_df = read_sequence_scores(monthlyComparison_dir+directory, ["Location"])
         country_score_df = pd.read_csv(monthlyComparison_dir+directory+"/antigenic_scores_map_visualization.csv", sep = "\t", usecols = ["Country", "country_score"])
         # Checking to see which countries have a frequency of greater than 1% of the global submitted sequences
         num_sequences = len(antigenic_score_df)
-        antigenic_score_df['Country'] = antigenic_score_df['Location'].apply(lambda x: x.split("/")[1])
-        # Some countries have spaces following them, here we need to remove that to get a proper count
-        country = []
-        for item in antigenic_score_df["Country"]:
-            x = item.lstrip()
-            y = x.rstrip()
-            country.append(y)
-        antigenic_score_df["Country"] = country
+        # The (stripped) country is parsed once per distinct location (and kept in the location cache of the repository)
+        antigenic_score_df['Country'] = location_columns(antigenic_score_df['Location'], ["Country"], REPOSITORY_LOCATION_CACHE)['Country']
         # Getting number of isolates and their frequency per country
         antigenic_score_countries_df = antigenic_score_df.value_counts(['Country']).reset_index().rename(columns={0:'num_isolates'})
         antigenic_score_countries_df["seq_frequency"] = antigenic_score_countries_df["num_isolates"] / num_sequences
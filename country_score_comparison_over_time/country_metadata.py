@@ -16,6 +16,10 @@
 import sys
 import os
 import pandas as pd
+# The per-sequence scores reader of the scoring scripts (parquet, tsv and normalized layouts)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "software"))
+from sequence_scores import read_sequence_scores
+from location_parser import REPOSITORY_LOCATION_CACHE, location_columns
 
 # Importing the necessary directory
 results_directory = sys.argv[1]
@@ -32,19 +36,12 @@ for folder in os.listdir(results_directory):
         print("Month: ", folder)
         
         # Importing necessary DFs
-        antigenic_df = pd.read_csv(results_directory+folder+"/antigenic_scores_all.csv", 
-                                   sep = "\t", usecols = ["Location", "Pango lineage", "antigenic_score"])
+        antigenic_df = read_sequence_scores(results_directory+folder, ["Location", "Pango lineage", "antigenic_score"])
         countries_month_df = countries_df[countries_df["date"] == folder]
         
         # Adding a country column to results df
-        antigenic_df['Country'] = antigenic_df['Location'].apply(lambda x: x.split("/")[1])
-        # Some countries have spaces following them, here we need to remove that to get a proper count
-        country = []
-        for item in antigenic_df["Country"]:
-            x = item.lstrip()
-            y = x.rstrip()
-            country.append(y)
-        antigenic_df["Country"] = country
+        # The (stripped) country is parsed once per distinct location (and kept in the location cache of the repository)
+        antigenic_df['Country'] = location_columns(antigenic_df['Location'], ["Country"], REPOSITORY_LOCATION_CACHE)['Country']
         
         # Calculating lineage frequency for countries in the countries_df file
         countries = list(countries_month_df["Country"].unique())
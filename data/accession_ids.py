@@ -16,6 +16,9 @@
 import sys
 import os
 import pandas as pd
+# The per-sequence scores reader of the scoring scripts (parquet, tsv and normalized layouts)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "software"))
+from sequence_scores import read_sequence_scores
 
 results_dir = sys.argv[1]
 output = sys.argv[2]
@@ -30,7 +33,7 @@ for month_dir in os.listdir(results_dir):
     print(month_dir)
     if '-202' in month_dir:
         print("Parsing through: ", month_dir)
-        df = pd.read_csv(results_dir+month_dir+"/antigenic_scores_all.csv", sep = "\t", usecols = ["Accession ID"])
+        df = read_sequence_scores(results_dir+month_dir, ["Accession ID"])
         print("Number of IDs: ", len(df))
         ids = pd.concat([ids, df], ignore_index = True)
         print("Total Number of IDs: ", len(ids))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Daily aggregate cube of the scored sequences used by the variant_scoring_*.py scripts (--cube <directory>).
+# The cube holds one entry per (collection date, location, lineage) with the number of sequences and the sum and
+# sum of squares of their weights, which is all that the lineage, country and period scores need. Every run adds
+# the months it scored (a month that is scored again replaces its earlier entries), so the cube grows across runs
+# and the monthly, quarterly or country views are calculated from it without reading the per-sequence scores.
+#
+# <cube dir>/<strategy>/cube_<YYYY-MM>.tsv : Collection date, Location, Pango lineage, sequences, weight_sum, weight_sumsq
+# <cube dir>/<strategy>/weights_fingerprint.txt : md5 of the files that define the weights (see weight_store.py)
+#
+# The sliding window scores (window_scoring.py) are calculated from running (prefix) sums of the daily counts and weight
+# sums, the sums of any window of days are then the difference of two rows of the running sums.
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+from location_parser import location_columns
+
+CUBE_KEYS = ["Collection date", "Location", "Pango lineage"]
+CUBE_VALUES = ["sequences", "weight_sum", "weight_sumsq"]
+CUBE_PREFIX = "cube_"
+FINGERPRINT_FILE = "weights_fingerprint.txt"
+
+def cube_month_path(strategy_dir, month):
+    # Function to return the path of the cube entries of a collection month (YYYY-MM)
+    return (os.path.join(strategy_dir, CUBE_PREFIX + month + ".tsv"))
+
+def cube_months(strategy_dir):
+    # Function to return the (sorted) collection months that are in the cube of a strategy
+    paths = glob.glob(os.path.join(strategy_dir, CUBE_PREFIX + "*.tsv"))
+    return (sorted(os.path.basename(path)[len(CUBE_PREFIX):-len(".tsv")] for path in paths))
+
+def write_cube(cube, strategy_dir, fingerprint):
+    # Function to add the cube entries of this run to the cube of a strategy, one file per collection month (the entries of
+    # a month from an earlier run are replaced). The months of a cube that was created with different weights are removed
+    os.makedirs(strategy_dir, exist_ok = True)
+    fingerprint_path = os.path.join(strategy_dir, FINGERPRINT_FILE)
+    if os.path.isfile(fingerprint_path):
+        with open(fingerprint_path) as handle:
+            stored_fingerprint = handle.read().strip()
+        if stored_fingerprint != fingerprint:
+            print("The cube in ", strategy_dir, " was created with different weights, removing its months: ", ", ".join(cube_months(strategy_dir)))
+            for month in cube_months(strategy_dir):
+                os.remove(cube_month_path(strategy_dir, month))
+    with open(fingerprint_path, "w") as handle:
+        handle.write(fingerprint + "\n")
+    collection_months = cube["Collection date"].astype(str).str[:7]
+    # Entries without a collection month (ie. a date of only the year) are not kept
+    collection_months = collection_months.where(collection_months.str.match(r'^\d{4}-\d{2}$'))
+    for month, month_cube in cube.groupby(collection_months.values, sort = True):
+        # Writing to a temporary file first, so that an interrupted run does not leave a broken month
+        temporary_path = os.path.join(strategy_dir, "." + CUBE_PREFIX + month + ".tmp")
+        month_cube.to_csv(temporary_path, sep = '\t', index = False, header = True)
+        os.replace(temporary_path, cube_month_path(strategy_dir, month))
+        print("Cube entries saved for ", month, ": ", len(month_cube))
+
+def read_cube(strategy_dir, months = None):
+    # Function to read the cube entries of the given collection months (YYYY-MM, all months of the cube if None)
+    months = cube_months(strategy_dir) if months is None else [month for month in months if os.path.isfile(cube_month_path(strategy_dir, month))]
+    if len(months) == 0:
+        return (pd.DataFrame(columns = CUBE_KEYS + CUBE_VALUES))
+    dtypes = {"Collection date": "str", "Location": "str", "Pango lineage": "str", "sequences": "int64", "weight_sum": "float64", "weight_sumsq": "float64"}
+    cube = [pd.read_csv(cube_month_path(strategy_dir, month), sep = '\t', dtype = dtypes, keep_default_na = False, na_values = [""],
+                        float_precision = 'round_trip') for month in months]
+    return (pd.concat(cube, ignore_index = True))
+
+def cube_periods(collection_dates, period):
+    # Function to return the period (month YYYY-MM, quarter YYYY-Q<n> or year YYYY) of every collection date, NaN if the date is too short
+    collection_dates = pd.Series(collection_dates, dtype = object).astype(str)
+    if period == "year":
+        return (collection_dates.str[:4].values)
+    months = collection_dates.str[:7].where(collection_dates.str.match(r'^\d{4}-\d{2}'))
+    if period == "month":
+        return (months.values)
+    if period == "quarter":
+        quarters = (pd.to_numeric(months.str[5:7]) - 1) // 3 + 1
+        return ((months.str[:4] + "-Q" + quarters.fillna(0).astype(int).astype(str)).where(months.notna()).values)
+    raise ValueError("Invalid period: " + str(period) + " (expected month, quarter or year)")
+
+def cube_view(cube, by, period = None, location_cache = None):
+    # Function to roll the cube up to the given columns (any of Pango lineage, Location, Continent, Country, Region, ISO2 and, with a
+    # period, the month, quarter or year of the collection dates as Period). Every row has the number of sequences, the mean
+    # weight (the antigenic score of a lineage) and the variance of the weights
+    cube = cube.copy()
+    location_parts = [column for column in by if column in ("Continent", "Country", "Region", "ISO2")]
+    if len(location_parts) > 0:
+        cube = pd.concat([cube, location_columns(cube["Location"], location_parts, location_cache)], axis = 1)
+    if period is not None:
+        cube["Period"] = cube_periods(cube["Collection date"], period)
+        by = ["Period"] + list(by)
+    view = cube.groupby(list(by), sort = True)[CUBE_VALUES].sum().reset_index()
+    view["mean_weight"] = view["weight_sum"] / view["sequences"]
+    # Sample variance of the weights (0 for a single sequence)
+    view["weight_variance"] = np.where(view["sequences"] > 1, (view["weight_sumsq"] - view["weight_sum"] * view["mean_weight"]) / (view["sequences"] - 1).clip(lower = 1), 0.0)
+    return (view)
+
+def cube_lineage_scores(cube):
+    # Function to return the lineage table of the cube entries (Pango lineage, antigenic_score, count) as used by the ranking of the scoring scripts
+    view = cube_view(cube, ["Pango lineage"])
+    return (view.rename(columns = {"mean_weight": "antigenic_score", "sequences": "count"})[["Pango lineage", "antigenic_score", "count"]])
+
+def cube_country_scores(cube, location_cache = None):
+    # Function to return the country scores of the cube entries (Continent, Country, country_score) like the map visualization, the
+    # country score is the sum of the lineage antigenic scores (of all countries) weighted by the lineage frequency in the country
+    lineage_scores = cube_lineage_scores(cube).set_index("Pango lineage")["antigenic_score"]
+    country_lineages = cube_view(cube[cube["Pango lineage"] != "None"], ["Continent", "Country", "Pango lineage"], location_cache = location_cache)
+    country_lineages["frequency"] = country_lineages["sequences"] / country_lineages.groupby("Country")["sequences"].transform("sum")
+    country_lineages["score"] = lineage_scores.reindex(country_lineages["Pango lineage"]).values * country_lineages["frequency"]
+    return (country_lineages.groupby(["Continent", "Country"], sort = True)["score"].sum().rename("country_score").reset_index())
+
+def cube_days(collection_dates):
+    # Function to return the day number (days since 1970-01-01) of every collection date, -1 for the partial dates (YYYY or YYYY-MM)
+    collection_dates = pd.Series(collection_dates, dtype = object).astype(str)
+    dates = pd.to_datetime(collection_dates.where(collection_dates.str.match(r'^\d{4}-\d{2}-\d{2}$')), format = "%Y-%m-%d", errors = "coerce")
+    return (np.where(dates.isna(), -1, dates.values.astype('datetime64[D]').astype('int64')))
+
+def prefix_sums(days, group_codes, values, first_day, n_days, n_groups):
+    # Function to return the running sums of the values per day and group (n_days + 1 rows, the first row is 0), the sum of the
+    # days start to stop (exclusive, counted from first_day) of every group is then prefix[stop] - prefix[start]
+    daily = np.zeros((n_days + 1, n_groups))
+    inside = (days >= first_day) & (days < first_day + n_days) & (group_codes >= 0)
+    np.add.at(daily, (days[inside] - first_day + 1, group_codes[inside]), values[inside])
+    return (np.cumsum(daily, axis = 0))
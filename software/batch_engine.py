@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Batch executor used by the variant_scoring_*.py scripts. Instead of splitting a month into thousands
+# of ten row chunks, the rows are processed in a few large (vectorized) batches whose size follows from
+# a memory budget, ie. "--max-memory 4G". The batches are views on the input, so the month is not copied.
+
+import math
+import time
+
+DEFAULT_MAX_MEMORY = "1G"
+# Estimated working memory of a batch relative to the size of its rows (the tokenized substitutions,
+# regular expression matches and intermediate frames of a row are much larger than its AA Substitutions string)
+WORKING_SET_FACTOR = 16
+MEMORY_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_memory_size(size):
+    # Function to convert a memory size like "4G", "512M" or "1000000" (bytes) to a number of bytes
+    size = str(size).strip().upper().rstrip('B')
+    unit = size[-1:] if size[-1:] in MEMORY_UNITS else ''
+    try:
+        value = float(size[:len(size) - len(unit)])
+    except ValueError:
+        raise ValueError("Invalid memory size: " + str(size) + " (expected ie. 4G, 512M or a number of bytes)")
+    if value <= 0:
+        raise ValueError("Invalid memory size: " + str(size) + " (has to be larger than 0)")
+    return (int(value * MEMORY_UNITS[unit]))
+
+def batch_rows(frame, max_memory):
+    # Function to return the number of rows per batch so that the estimated working memory of a batch stays within max_memory (bytes)
+    if len(frame) == 0:
+        return (1)
+    row_bytes = frame.memory_usage(index = False, deep = True).sum() / len(frame) * WORKING_SET_FACTOR
+    return (max(int(max_memory // max(row_bytes, 1)), 1))
+
+def process_batches(frame, function, max_memory, skip_errors = False):
+    # Function to apply function to the frame in memory budgeted batches and return the list of results,
+    # with skip_errors a failing batch is reported and skipped instead of stopping the analysis
+    rows = batch_rows(frame, max_memory)
+    n_batches = math.ceil(len(frame) / rows)
+    print("Rows to process: ", len(frame), ", rows per batch: ", rows, ", number of batches: ", n_batches, "\n")
+    results = []
+    for batch_number, start in enumerate(range(0, len(frame), rows), start = 1):
+        batch = frame.iloc[start:start + rows]
+        batch_start = time.perf_counter()
+        try:
+            results.append(function(batch))
+        except Exception as error:
+            if not skip_errors:
+                raise
+            print("Error in running batch ", batch_number, " - moving on to the next: ", error)
+            continue
+        batch_seconds = max(time.perf_counter() - batch_start, 1e-9)
+        print("Batch {}/{}: {} rows in {:.2f} s ({:.0f} rows/s)".format(batch_number, n_batches, len(batch), batch_seconds, len(batch) / batch_seconds))
+    return (results)
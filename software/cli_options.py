@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Command line helpers shared by the scripts, kept free of other dependencies so that the plotting and compiler
+# scripts can parse their optional arguments without loading the scoring engine.
+
+def pop_option(argv, option):
+    # Function to remove an optional "--option value" pair from the arguments and return the value (None if not given)
+    if option not in argv:
+        return (None)
+    option_index = argv.index(option)
+    value = argv[option_index + 1]
+    del argv[option_index:option_index + 2]
+    return (value)
+
+def pop_flag(argv, option):
+    # Function to remove an optional "--option" flag from the arguments and return whether it was given
+    if option not in argv:
+        return (False)
+    argv.remove(option)
+    return (True)
@@ -7,15 +7,22 @@
 # 
 # Script to identify which countries have at least 1% of the monthly sequences (mostly for the earlier months ie. Jan 2020) or have 500 sequences. These countries will then be used for the country_score_comparison_over_time analysis. 
 
-import os
 import sys
 import pandas as pd
 import numpy as np
-
+from sequence_scores import read_sequence_scores
+from location_parser import DEFAULT_LOCATION_CACHE, location_columns
+from cli_options import pop_option
+from monthly_store import THRESHOLD_STORE, open_store, read_manifest, write_store_month
+
+# Optional directory of the monthly store of the threshold countries (--store <directory>, default the output directory), the
+# reference directory is only read
+store_dir = pop_option(sys.argv, "--store")
 output = sys.argv[1]
 monthlyComparison_dir = sys.argv[2]
 reference_dir = sys.argv[3]
 month_file = open(sys.argv[4])
+store_dir = store_dir or output
 
 # Reading in current month
 month_file.seek(0)
@@ -26,34 +33,29 @@ print("output: ", output)
 print("monthly comparison dir: ", monthlyComparison_dir)
 print("month: ", month)
 
-# Reading in cumulative file and if no data exists quitting script
-if os.path.exists(reference_dir + "country_list_with_threshold.tsv") == True:
-    df_cumulative = pd.read_csv(reference_dir + "country_list_with_threshold.tsv", sep='\t')
-    print("Cumulative DF File: ")
-    print(pd.DataFrame.head(df_cumulative))
+# Opening the monthly store (filled from the cumulative file on the first run) and if no data exists quitting script
+store_path = open_store(store_dir, THRESHOLD_STORE, reference_dir)
+store_manifest = read_manifest(store_path)
+if len(store_manifest) > 0:
+    print("Months in the store: ")
+    print(pd.DataFrame.tail(store_manifest))
 else:
-    print("No cumulative country-wise file, please check! Now exiting...")
+    print("No cumulative country-wise store or file, please check! Now exiting...")
     quit()
 
 # Parsing through the month directories to find countries that had at least 1% of sequences
 print("Reading In Input DFs: ")
-antigenic_score_df = pd.read_csv(monthlyComparison_dir+"/antigenic_scores_all.csv", sep = '\t', usecols = ["Location", "Pango lineage"])
+# Per-sequence scores from antigenic_scores_all.parquet (--output-format parquet) or antigenic_scores_all.csv, only the needed columns are read
+antigenic_score_df = read_sequence_scores(monthlyComparison_dir, ["Location", "Pango lineage"])
 country_score_df = pd.read_csv(monthlyComparison_dir+"/antigenic_scores_map_visualization.csv", sep = "\t", usecols = ["Country", "country_score"])
 zscore_df = pd.read_csv(monthlyComparison_dir+"/antigenic_scores_ranked_with_WHO.csv", sep = "\t", usecols = ["Pango lineage", "antigenic_score", "zscore"])
 
 # Checking to see which countries have a frequency of greater than 1% of the global submitted sequences
 print("Adding number of seqeunces and parsing out country information: ")
 num_sequences = len(antigenic_score_df)
-antigenic_score_df['Country'] = antigenic_score_df['Location'].apply(lambda x: x.split("/")[1])
-        
-# Some countries have spaces following them, here we need to remove that to get a proper count
+# The (stripped) country is parsed once per distinct location (and kept in the location cache of the reference directory)
 print("Formatting of country names: ")
-country = []
-for item in antigenic_score_df["Country"]:
-    x = item.lstrip()
-    y = x.rstrip()
-    country.append(y)
-antigenic_score_df["Country"] = country
+antigenic_score_df['Country'] = location_columns(antigenic_score_df['Location'], ["Country"], reference_dir + DEFAULT_LOCATION_CACHE)['Country']
 print(pd.DataFrame.head(antigenic_score_df))
 
 # Getting number of isolates and their frequency per country (to identify countries that match the threshold)
@@ -118,17 +120,9 @@ print("Adding date column: ")
 print(pd.DataFrame.head(freq_countries_monthly_df))
 freq_countries_monthly_df['date'] = str(month)
 
-# Checking to see if the month has already been added to the cumulative file, and if not, adding it
-print("Adding new countries to the cumulative file: ")
-if df_cumulative['date'].eq(month).any():
-    df_cumulative = df_cumulative[~df_cumulative['date'].eq(month)]
-print("DF Cumulative (with previous month removed): ")
-print(pd.DataFrame.head(df_cumulative))
-print(pd.DataFrame.tail(df_cumulative))
-
-df_cumulative = pd.concat([df_cumulative, freq_countries_monthly_df])
+# Adding the month to the store, only the month is written (a month that is already in the store is replaced)
+print("Adding new countries to the monthly store: ")
+write_store_month(freq_countries_monthly_df, store_path, month)
 print("FINAL")
-print(pd.DataFrame.head(df_cumulative))
-print(pd.DataFrame.tail(df_cumulative))
-
-df_cumulative.to_csv(reference_dir + "country_list_with_threshold.tsv", sep='\t', index=False, header=True)
+print(pd.DataFrame.head(freq_countries_monthly_df))
+print(pd.DataFrame.tail(freq_countries_monthly_df))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Exclusion set of the sequences under review used by the variant_scoring_*.py scripts. The accession ids
+# (EPI_ISL_<number>) are held as a sorted array of their numbers, so that the metadata rows can be tested
+# for membership with a vectorized binary search instead of comparing strings against a python list.
+# With --exclusions <file> the set is kept between runs (numpy .npy file) and the sequences under review
+# of every run are added to it, so the under review lists of several months accumulate.
+
+import os
+import numpy as np
+import pandas as pd
+
+ACCESSION_PREFIX = "EPI_ISL_"
+
+def accession_numbers(accession_ids):
+    # Function to return the number of every accession id (EPI_ISL_<number>), ids that are not of that form get -1
+    accession_ids = pd.Series(accession_ids, dtype = object).astype(str)
+    numbers = pd.to_numeric(accession_ids.str.extract('^' + ACCESSION_PREFIX + r'(\d+)$', expand = False), errors = 'coerce')
+    return (numbers.fillna(-1).astype('int64').values)
+
+def exclusion_array(accession_ids):
+    # Function to return the sorted array of the (distinct) accession numbers of the given accession ids
+    numbers = accession_numbers(accession_ids)
+    if (numbers < 0).any():
+        print("Skipping ", (numbers < 0).sum(), " excluded ids that are not ", ACCESSION_PREFIX, "accession ids")
+    return (np.unique(numbers[numbers >= 0]))
+
+def is_excluded(accession_ids, exclusion):
+    # Function to return a boolean mask of the accession ids that are in the exclusion array (binary search in the sorted array)
+    numbers = accession_numbers(accession_ids)
+    if len(exclusion) == 0:
+        return (np.zeros(len(numbers), dtype = bool))
+    positions = np.minimum(np.searchsorted(exclusion, numbers), len(exclusion) - 1)
+    return ((exclusion[positions] == numbers) & (numbers >= 0))
+
+def load_exclusion_set(exclusion_path):
+    # Function to read the stored exclusion array, an empty array is returned if there is none yet
+    if not os.path.isfile(exclusion_path):
+        print("No exclusion set found at ", exclusion_path, ", starting a new one")
+        return (np.zeros(0, dtype = 'int64'))
+    exclusion = np.load(exclusion_path)
+    print("Sequences in the exclusion set: ", len(exclusion))
+    return (exclusion)
+
+def update_exclusion_set(exclusion_path, accession_ids):
+    # Function to add the given accession ids to the stored exclusion array, returns the updated array
+    exclusion = np.union1d(load_exclusion_set(exclusion_path), exclusion_array(accession_ids))
+    exclusion_dir = os.path.dirname(os.path.abspath(exclusion_path))
+    os.makedirs(exclusion_dir, exist_ok = True)
+    # Writing to a temporary file first, so that an interrupted run does not leave a broken exclusion set
+    temporary_path = os.path.join(exclusion_dir, "." + os.path.basename(exclusion_path) + ".tmp.npy")
+    np.save(temporary_path, exclusion)
+    os.replace(temporary_path, exclusion_path)
+    print("Sequences saved in the exclusion set: ", len(exclusion))
+    return (exclusion)
@@ -2,14 +2,21 @@
 # coding: utf-8
 
 import sys
-import os
 import pandas as pd
 import plotly.express as px
+from cli_options import pop_option, pop_flag
+from monthly_store import MAP_STORE, open_store, read_manifest, write_store_month, read_store
 
+# Optional directory of the monthly store of the country scores (--store <directory>, default the output directory), the
+# reference directory is only read
+store_dir = pop_option(sys.argv, "--store")
+# A month that is already in the store is kept (like the cumulative file) unless --replace is given
+replace_month = pop_flag(sys.argv, "--replace")
 df = pd.read_csv(sys.argv[1], sep = "\t")
 output = sys.argv[2]
 month_file = open(sys.argv[3])
 reference_dir = sys.argv[4]
+store_dir = store_dir or output
 
 # Reading in current month
 month_file.seek(0)
@@ -53,19 +60,15 @@ fig_eu.update_annotations(font = dict(size = 20))
 fig_eu.write_html(output + 'antigenic_score_map_europe.html')
 
 # Creating global map with slider through time frame
-## Checking to see if antigenic_scores_map_visualization_cumulative.csv exists, and if not creating one
+## Adding the month to the monthly store of the country scores if it is not there yet (only the month is written), with --replace
+## a month that is run again is replaced
 df['date'] = month
-if os.path.exists(reference_dir + "antigenic_scores_map_visualization_cumulative.csv") == False:
-    df.to_csv(reference_dir + "antigenic_scores_map_visualization_cumulative.csv", sep=',', index=False, header=True)
-    df_cumulative = df
+store_path = open_store(store_dir, MAP_STORE, reference_dir)
+if replace_month or not read_manifest(store_path)["date"].eq(month).any():
+    write_store_month(df, store_path, month)
 else:
-    df_cumulative = pd.read_csv(reference_dir + "antigenic_scores_map_visualization_cumulative.csv", sep = ',')
-
-if not (df_cumulative['date'].eq(month)).any():
-    df_cumulative = pd.concat([df_cumulative, df])
-    df_cumulative.to_csv(reference_dir + "antigenic_scores_map_visualization_cumulative.csv", sep=',', index=False, header=True)
-else:
-    pass
+    print("The month ", month, " is already in the store ", store_path, ", keeping it (use --replace to replace it)")
+df_cumulative = read_store(store_path)
 
 labels_dict = dict(zip(df_cumulative.Country, df_cumulative.country_score))
 fig = px.choropleth(df_cumulative, locations = "Country",
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Location parser shared by the scoring and country scripts. The GISAID Location ("Continent / Country / Region / ...")
+# is split once per distinct location instead of once per sequence, and the countries get their ISO 3166 alpha-2
+# and alpha-3 codes (the alpha-2 codes are the country directories of the SD plots frequencies, ie. SDplots_frequencies/DE).
+# The codes are looked up with pycountry, GISAID country names that pycountry does not know are taken from
+# COUNTRY_OVERRIDES. With a cache file (tsv) the parsed locations are kept between runs and only new locations
+# are parsed, delete the file to parse all locations again (ie. after changing COUNTRY_OVERRIDES).
+
+import os
+import numpy as np
+import pandas as pd
+
+LOCATION_PARTS = ["Continent", "Country", "Region"]
+LOCATION_COLUMNS = ["Location"] + LOCATION_PARTS + ["ISO2", "ISO3"]
+DEFAULT_LOCATION_CACHE = "location_codes.tsv"
+# Location cache of the repository (reference/location_codes.tsv, as passed by the pipeline scripts) for the scripts without a reference directory argument
+REPOSITORY_LOCATION_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "reference", DEFAULT_LOCATION_CACHE)
+# GISAID country names that pycountry does not resolve (alpha-2, alpha-3), the parts of the United Kingdom get its code. The
+# islands of the Caribbean Netherlands stay separate countries without a code (they would share BQ, and the SD plots frequencies
+# have a Bonaire directory), so that a code never stands for more than one of their names
+COUNTRY_OVERRIDES = {"Russia": ("RU", "RUS"), "Kosovo": ("XK", "XKX"), "Turkey": ("TR", "TUR"), "Brunei": ("BN", "BRN"),
+                     "Democratic Republic of the Congo": ("CD", "COD"), "Republic of the Congo": ("CG", "COG"), "Republic of Congo": ("CG", "COG"),
+                     "Cote d'Ivoire": ("CI", "CIV"), "Ivory Coast": ("CI", "CIV"), "Palestine": ("PS", "PSE"), "Micronesia": ("FM", "FSM"),
+                     "Bonaire": (np.nan, np.nan), "Sint Eustatius": (np.nan, np.nan), "Saba": (np.nan, np.nan), "Sint Maarten": ("SX", "SXM"),
+                     "Curacao": ("CW", "CUW"), "Saint Martin": ("MF", "MAF"), "Saint Barthelemy": ("BL", "BLM"), "Reunion": ("RE", "REU"),
+                     "Cape Verde": ("CV", "CPV"), "U.S. Virgin Islands": ("VI", "VIR"), "Falkland Islands": ("FK", "FLK"),
+                     "Guinea Bissau": ("GW", "GNB"), "The Bahamas": ("BS", "BHS"), "Macau": ("MO", "MAC"), "Burma": ("MM", "MMR"),
+                     "Swaziland": ("SZ", "SWZ"), "Vatican": ("VA", "VAT"), "Holy See": ("VA", "VAT"), "St. Lucia": ("LC", "LCA"),
+                     "England": ("GB", "GBR"), "Scotland": ("GB", "GBR"), "Wales": ("GB", "GBR"), "Northern Ireland": ("GB", "GBR")}
+
+def split_locations(locations):
+    # Function to split the (distinct) locations into their stripped continent, country and region, missing parts are NaN
+    parts = pd.Series(np.asarray(locations, dtype = object), dtype = object).astype(str).str.split("/")
+    split = pd.DataFrame({part: parts.str[position].astype(object) for position, part in enumerate(LOCATION_PARTS)})
+    # A part that none of the locations has stays NaN (the .str accessor needs at least one string)
+    return (split.apply(lambda values: values.str.strip() if values.notna().any() else values))
+
+def country_iso_codes(countries):
+    # Function to return the ISO alpha-2 and alpha-3 codes of the (distinct) country names, NaN for the countries without a code
+    try:
+        import pycountry
+    except ImportError:
+        pycountry = None
+        print("pycountry is not installed, only the ISO codes of the country overrides are added")
+    codes = []
+    for country in countries:
+        code = COUNTRY_OVERRIDES.get(country, (np.nan, np.nan))
+        if country not in COUNTRY_OVERRIDES and pycountry is not None and isinstance(country, str):
+            try:
+                match = pycountry.countries.lookup(country)
+                code = (match.alpha_2, match.alpha_3)
+            except LookupError:
+                print("No ISO code found for the country: ", country)
+        codes.append(code)
+    return (pd.DataFrame(codes, columns = ["ISO2", "ISO3"], dtype = object))
+
+def parse_locations(locations, cache_path = None):
+    # Function to return the table of the distinct locations with their continent, country, region and ISO codes (columns
+    # LOCATION_COLUMNS, in the order of the given locations), with a cache path only the locations that are not cached are parsed
+    locations = pd.unique(np.asarray(locations, dtype = object))
+    cached = pd.DataFrame(columns = LOCATION_COLUMNS, dtype = object)
+    if cache_path is not None and os.path.isfile(cache_path):
+        cached = pd.read_csv(cache_path, sep = '\t', dtype = object, keep_default_na = False, na_values = [""])
+    new_locations = locations[~pd.Series(locations).isin(cached["Location"]).values]
+    if len(new_locations) > 0:
+        print("Parsing new locations: ", len(new_locations))
+        parsed = split_locations(new_locations)
+        countries = pd.unique(parsed["Country"].values)
+        iso_codes = country_iso_codes(countries).set_index(pd.Index(countries, dtype = object))
+        parsed = pd.concat([pd.DataFrame({"Location": new_locations}), parsed, iso_codes.reindex(parsed["Country"].values).reset_index(drop = True)], axis = 1)
+        cached = pd.concat([cached, parsed], ignore_index = True)
+        if cache_path is not None:
+            cached.to_csv(cache_path, sep = '\t', index = False, header = True)
+    return (cached.set_index("Location").reindex(pd.Index(locations, dtype = object, name = "Location")).reset_index())
+
+def location_columns(locations, columns, cache_path = None):
+    # Function to return the given columns of the parsed location (ie. ["Continent", "Country"]) for every row, the distinct
+    # locations are parsed once and the rows take their values by location code
+    codes, distinct_locations = pd.factorize(pd.Series(locations))
+    parsed = parse_locations(np.asarray(distinct_locations, dtype = object), cache_path)
+    return (pd.DataFrame({column: np.append(parsed[column].values, np.nan)[codes] for column in columns}, index = getattr(locations, "index", None)))
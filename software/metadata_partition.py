@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# ## Metadata Partitioning
+#
+# One-time ingest step that converts the GISAID metadata.tsv into a parquet dataset partitioned by
+# collection month (<dataset dir>/collection_month=YYYY-MM/part-NNNNN.parquet). Only the six columns
+# used by the variant_scoring_*.py scripts are kept. The dataset directory can then be given to the
+# scoring scripts in place of the metadata.tsv, and each run only reads the partition(s) it needs.
+#
+# To Run:
+# python metadata_partition.py <path to metadata.tsv (or .tar.xz, .xz, .gz, .zst)> <path to dataset directory>
+
+import os
+import sys
+import datetime
+import pandas as pd
+from metadata_reader import METADATA_COLUMNS, METADATA_DTYPES, PARTITION_PREFIX, collection_months, open_metadata
+
+start_time = datetime.datetime.now()
+
+metadata_path = sys.argv[1]
+dataset_dir = sys.argv[2]
+chunksize = 500000
+
+print("metadata file: ", metadata_path)
+print("dataset directory: ", dataset_dir)
+
+# Refusing to write into an existing dataset, otherwise rows would be duplicated across part files
+if os.path.isdir(dataset_dir) and len(os.listdir(dataset_dir)) > 0:
+    print("ERROR - the dataset directory is not empty, please remove it or choose a new directory!")
+    sys.exit(1)
+os.makedirs(dataset_dir, exist_ok = True)
+
+rows_read = 0
+rows_skipped = 0
+part = 0
+with open_metadata(metadata_path) as handle:
+    for chunk in pd.read_csv(handle, sep = '\t', usecols = METADATA_COLUMNS, dtype = METADATA_DTYPES, chunksize = chunksize):
+        rows_read = rows_read + len(chunk)
+        months = collection_months(chunk['Collection date'])
+        # Sequences without a collection month can never be selected for a monthly analysis
+        rows_skipped = rows_skipped + months.isna().sum()
+        for month, month_chunk in chunk.groupby(months, sort = False):
+            month_dir = os.path.join(dataset_dir, PARTITION_PREFIX + month)
+            os.makedirs(month_dir, exist_ok = True)
+            month_chunk[METADATA_COLUMNS].to_parquet(os.path.join(month_dir, "part-{:05d}.parquet".format(part)), index = False)
+        part = part + 1
+        print("Rows partitioned: ", rows_read)
+
+print("Rows without a collection month (not written): ", rows_skipped)
+print("Number of month partitions: ", len(os.listdir(dataset_dir)))
+end_time = datetime.datetime.now()
+print('Duration: {}'.format(end_time - start_time))
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shared reader for the GISAID metadata.tsv used by the variant_scoring_*.py scripts. The file is
+# streamed in chunks and the month, host and sequences under review filters are applied to every
+# chunk as it is read, so only the rows of the requested month(s) are ever held in memory.
+# The metadata path can also be a dataset directory created by metadata_partition.py, in which
+# case only the parquet partitions of the requested month(s) are read, or a compressed GISAID
+# snapshot (.tar.xz, .xz, .gz, .zst) that is decompressed on the fly while it is being read.
+#
+# The metadata is returned in a compact layout: the accession ids are held as their EPI_ISL numbers, the
+# collection dates as integer date codes (YYYYMMDD, with 00 for the missing day / month of partial dates)
+# and Location, Pango lineage and AA Substitutions as categoricals. readable_metadata converts the accession
+# ids and collection dates back to strings for the output files.
+
+import io
+import os
+import glob
+import gzip
+import lzma
+import shutil
+import tarfile
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+from exclusion_set import ACCESSION_PREFIX, accession_numbers, is_excluded
+
+METADATA_COLUMNS = ['Location', 'Collection date', 'Accession ID', 'Pango lineage', 'AA Substitutions', 'Host']
+METADATA_DTYPES = {"Host": "category", "Location": "category", "Pango lineage": "category", "Collection date": "str"}
+PARTITION_PREFIX = "collection_month="
+# Columns that are kept as categoricals (dictionary encoded) after reading
+CATEGORICAL_COLUMNS = ['Location', 'Pango lineage', 'AA Substitutions', 'Host']
+# External decompressors are preferred as they run in their own process (and with several threads for xz)
+DECOMPRESSORS = {".xz": [["xz", "-dc", "-T0"]], ".gz": [["pigz", "-dc"], ["gzip", "-dc"]], ".zst": [["zstd", "-dc"]]}
+
+def month_mask(collection_dates, months):
+    # Function to return a boolean mask of the collection dates that fall in any of the given months (YYYY-MM)
+    return collection_dates.str.startswith(tuple(months), na = False)
+
+def collection_months(collection_dates):
+    # Function to return the collection month (YYYY-MM) of each date, dates without a month are returned as NaN
+    return collection_dates.str.extract(r'^(\d{4}-\d{2})', expand = False)
+
+def month_range(months_spec):
+    # Function to return the list of months (YYYY-MM) of a range like "2020-01:2023-12" (a single month is also accepted)
+    first, _, last = months_spec.partition(":")
+    try:
+        first_period = pd.Period(first.strip(), freq = "M")
+        last_period = pd.Period((last or first).strip(), freq = "M")
+    except ValueError:
+        raise ValueError("Invalid month range: " + months_spec + " (expected YYYY-MM:YYYY-MM)")
+    if last_period < first_period:
+        raise ValueError("Invalid month range: " + months_spec + " (the last month is before the first month)")
+    return ([str(period) for period in pd.period_range(first_period, last_period, freq = "M")])
+
+def month_code(month):
+    # Function to return the integer code (year * 12 + month - 1) of a month (YYYY-MM), consecutive months have consecutive codes
+    period = pd.Period(str(month), freq = "M")
+    return (period.year * 12 + period.month - 1)
+
+def month_name(code):
+    # Function to return the month (YYYY-MM) of an integer month code
+    return ("{:04d}-{:02d}".format(int(code) // 12, int(code) % 12 + 1))
+
+def month_codes(collection_dates):
+    # Function to return the integer month code of each collection date (strings or date codes), dates without a month get -1
+    if pd.api.types.is_integer_dtype(collection_dates):
+        date_codes = np.asarray(collection_dates, dtype = 'int64')
+        codes = date_codes // 10000 * 12 + date_codes // 100 % 100 - 1
+        return (np.where((date_codes >= 0) & (date_codes // 100 % 100 > 0), codes, -1))
+    months = collection_months(pd.Series(collection_dates).astype(str))
+    codes = pd.to_numeric(months.str[:4]) * 12 + pd.to_numeric(months.str[5:7]) - 1
+    return (codes.fillna(-1).astype('int64').values)
+
+def month_index(collection_dates):
+    # Function to index the rows by their collection month, returns the row numbers sorted by month (rows of the same
+    # month keep their order) and the (start, stop) offsets of every month code into these row numbers
+    codes = month_codes(collection_dates)
+    order = np.argsort(codes, kind = 'stable')
+    month_list, starts, counts = np.unique(codes[order], return_index = True, return_counts = True)
+    offsets = {int(code): (int(start), int(start + count)) for code, start, count in zip(month_list, starts, counts) if code >= 0}
+    return (order, offsets)
+
+def month_rows(index, code):
+    # Function to return the row numbers of a month code from a month index (empty for a month without data)
+    order, offsets = index
+    start, stop = offsets.get(int(code), (0, 0))
+    return (order[start:stop])
+
+def compact_accession_ids(accession_ids):
+    # Function to return the EPI_ISL numbers of the accession ids, the ids are kept as they are if any of them is not an EPI_ISL id
+    numbers = accession_numbers(accession_ids)
+    if (numbers < 0).any():
+        print("Keeping the accession ids as strings, not all of them are ", ACCESSION_PREFIX, "ids")
+        return (np.asarray(accession_ids, dtype = object))
+    return (numbers)
+
+def readable_accession_ids(accession_ids):
+    # Function to return the accession ids as strings (EPI_ISL_<number>) from their compact form
+    if not pd.api.types.is_integer_dtype(accession_ids):
+        return (np.asarray(accession_ids, dtype = object))
+    return ((ACCESSION_PREFIX + pd.Series(accession_ids, dtype = 'int64').astype(str)).values)
+
+def compact_collection_dates(collection_dates):
+    # Function to return the date code (YYYYMMDD, 00 for a missing day or month) of every collection date, missing dates get -1.
+    # The dates are kept as they are if any of them can not be converted back to the same string
+    date_index, dates = pd.factorize(pd.Series(collection_dates, dtype = object))
+    parts = pd.Series(dates, dtype = object).astype(str).str.extract(r'^(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?$').astype('float64')
+    date_codes = parts[0] * 10000 + parts[1].fillna(0) * 100 + parts[2].fillna(0)
+    if date_codes.isna().any() or (readable_collection_dates(date_codes.fillna(-1).astype('int32').values) != np.asarray(dates, dtype = object)).any():
+        print("Keeping the collection dates as strings, not all of them are YYYY, YYYY-MM or YYYY-MM-DD dates")
+        return (np.asarray(collection_dates, dtype = object))
+    return (np.append(date_codes.values, -1).astype('int32')[date_index])
+
+def readable_collection_dates(date_codes):
+    # Function to return the collection dates as strings (YYYY-MM-DD, YYYY-MM or YYYY for partial dates) from their date codes
+    if not pd.api.types.is_integer_dtype(date_codes):
+        return (np.asarray(date_codes, dtype = object))
+    # Only the distinct dates (a few hundred per month) are formatted
+    date_index, codes = pd.factorize(np.asarray(date_codes, dtype = 'int64'))
+    dates = []
+    for code in codes:
+        year, month, day = code // 10000, code // 100 % 100, code % 100
+        date = np.nan if code < 0 else "{:04d}".format(year) + ("-{:02d}".format(month) if month > 0 else "") + ("-{:02d}".format(day) if day > 0 else "")
+        dates.append(date)
+    return (np.array(dates + [np.nan], dtype = object)[date_index])
+
+def compact_metadata(metadata):
+    # Function to convert the metadata to the compact layout (accession numbers, date codes and categoricals),
+    # missing lineages and locations are kept as the category "nan" (as they were when converted to strings)
+    metadata['Accession ID'] = compact_accession_ids(metadata['Accession ID'])
+    metadata['Collection date'] = compact_collection_dates(metadata['Collection date'])
+    for column in CATEGORICAL_COLUMNS:
+        metadata[column] = metadata[column].astype('category')
+    for column in ['Location', 'Pango lineage']:
+        if metadata[column].isna().any():
+            if 'nan' not in metadata[column].cat.categories:
+                metadata[column] = metadata[column].cat.add_categories('nan')
+            metadata[column] = metadata[column].fillna('nan')
+    return (metadata)
+
+def readable_metadata(metadata):
+    # Function to return a copy of the metadata with the accession ids and collection dates as strings (for the output files)
+    readable = metadata.copy()
+    for column, readable_column in (('Accession ID', readable_accession_ids), ('Collection date', readable_collection_dates)):
+        if column in readable.columns:
+            readable[column] = readable_column(readable[column].values)
+    return (readable)
+
+def concat_chunks(chunks):
+    # Function to concatenate the kept metadata chunks column by column, the categorical columns get the union of the
+    # categories of the chunks (pd.concat would convert categoricals with different categories back to strings)
+    columns = {}
+    for column in METADATA_COLUMNS:
+        if column in CATEGORICAL_COLUMNS:
+            columns[column] = union_categoricals([chunk[column].astype('category') for chunk in chunks])
+        else:
+            columns[column] = np.concatenate([chunk[column].values for chunk in chunks])
+    return (pd.DataFrame(columns))
+
+def partition_files(dataset_dir, month):
+    # Function to return the parquet files of one collection month partition
+    return sorted(glob.glob(os.path.join(dataset_dir, PARTITION_PREFIX + month, "*.parquet")))
+
+def compression_suffix(metadata_path):
+    # Function to return the compression suffix of the metadata file (None for an uncompressed file)
+    for suffix in (".tar.xz", ".txz", ".xz", ".gz", ".zst"):
+        if metadata_path.endswith(suffix):
+            return (suffix)
+    return (None)
+
+def decompressor_command(suffix):
+    # Function to return the first external decompression command that is installed for the given suffix
+    for command in DECOMPRESSORS.get(suffix, []):
+        if shutil.which(command[0]) is not None:
+            return (command)
+    return (None)
+
+def python_decompressor(metadata_path, suffix):
+    # Function to open the compressed file with the python standard library (single threaded fallback)
+    if suffix == ".xz":
+        return (lzma.open(metadata_path, "rb"))
+    if suffix == ".gz":
+        return (gzip.open(metadata_path, "rb"))
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Reading .zst files requires either the zstd command line tool or the zstandard python package")
+    return (zstandard.ZstdDecompressor().stream_reader(open(metadata_path, "rb"), closefd = True))
+
+class ForwardReader(io.RawIOBase):
+    # Read only, non seekable wrapper around a stream (tar members of a piped archive cannot be seeked)
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return (True)
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return (len(data))
+
+@contextmanager
+def open_metadata(metadata_path):
+    # Function to open the metadata file as a binary stream, compressed files are decompressed while they are read
+    # so that no decompressed copy is written to disk. For tar archives the metadata.tsv member is streamed.
+    suffix = compression_suffix(metadata_path)
+    if suffix is None:
+        handle = open(metadata_path, "rb")
+        try:
+            yield handle
+        finally:
+            handle.close()
+        return
+    stream_suffix = ".xz" if suffix in (".tar.xz", ".txz") else suffix
+    command = decompressor_command(stream_suffix)
+    process = None
+    if command is not None:
+        print("Decompressing with: ", " ".join(command))
+        process = subprocess.Popen(command + [metadata_path], stdout = subprocess.PIPE, bufsize = 1024 * 1024)
+        stream = process.stdout
+    else:
+        print("Decompressing with python ", stream_suffix, " module")
+        stream = python_decompressor(metadata_path, stream_suffix)
+    try:
+        if suffix in (".tar.xz", ".txz"):
+            archive = tarfile.open(fileobj = stream, mode = "r|")
+            member = next((m for m in archive if m.isfile() and m.name.endswith(".tsv")), None)
+            if member is None:
+                raise RuntimeError("No .tsv file found in the archive " + metadata_path)
+            print("Reading archive member: ", member.name)
+            yield io.BufferedReader(ForwardReader(archive.extractfile(member)), 1024 * 1024)
+        else:
+            yield stream
+    finally:
+        stream.close()
+        if process is not None:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            # A negative return code means the decompressor was stopped by us (SIGPIPE / SIGTERM)
+            if process.returncode > 0:
+                raise RuntimeError("Decompression of " + metadata_path + " failed with exit code " + str(process.returncode))
+
+def metadata_chunks(metadata_path, months, chunksize = 100000):
+    # Function to yield chunks of the metadata that were collected in the given months, either from the
+    # partitioned dataset (if the path is a directory) or by streaming the (compressed) metadata file
+    if os.path.isdir(metadata_path):
+        for month in months:
+            for part in partition_files(metadata_path, month):
+                yield pd.read_parquet(part, columns = METADATA_COLUMNS)
+    else:
+        with open_metadata(metadata_path) as handle:
+            for chunk in pd.read_csv(handle, sep = '\t', usecols = METADATA_COLUMNS, dtype = METADATA_DTYPES, chunksize = chunksize):
+                yield chunk.loc[month_mask(chunk['Collection date'], months), METADATA_COLUMNS]
+
+def read_monthly_metadata(metadata_path, months, exclusion = None, host = "Human", chunksize = 100000):
+    # Function to read the metadata and only keep the rows collected in the given months (YYYY-MM), from the given host and
+    # whose accession number is not in the exclusion array (sequences under review, see exclusion_set.py), returns the compact layout
+    months = [str(month) for month in months]
+    print("Reading metadata for months: ", ", ".join(months))
+    kept_chunks = []
+    for chunk in metadata_chunks(metadata_path, months, chunksize):
+        keep = pd.Series(True, index = chunk.index)
+        if host is not None:
+            keep = keep & (chunk['Host'] == host)
+        if exclusion is not None and len(exclusion) > 0:
+            keep = keep & ~is_excluded(chunk['Accession ID'].values, exclusion)
+        # The AA Substitutions of a chunk are dictionary encoded right away, most sequences share their profile
+        kept_chunks.append(chunk.loc[keep].astype({'AA Substitutions': 'category'}))
+    if len(kept_chunks) == 0:
+        metadata = pd.DataFrame(columns = METADATA_COLUMNS)
+    else:
+        metadata = concat_chunks(kept_chunks)
+    print("Rows kept: ", len(metadata))
+    return (compact_metadata(metadata))
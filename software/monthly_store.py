@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Append-only monthly stores of the cumulative tables of the pipeline, the country scores of the global map
+# (formerly reference/antigenic_scores_map_visualization_cumulative.csv) and the countries that pass the sequence
+# threshold (formerly reference/country_list_with_threshold.tsv). Every month (date MM-YYYY) is its own partition and
+# a manifest lists the months with their partition file and number of rows, so writing or replacing a month only
+# writes that month (and the small manifest) and a reader only reads the partitions of the months it asks for. A new
+# store is filled once from the cumulative file of the reference directory, which is only read and no longer written.
+#
+# <store dir>/<store>/manifest.tsv : date, file, rows (in month order)
+# <store dir>/<store>/<YYYY-MM>.tsv : rows of the month (tab separated, including the date column)
+
+import os
+import pandas as pd
+
+MANIFEST_FILE = "manifest.tsv"
+MANIFEST_COLUMNS = ["date", "file", "rows"]
+MAP_STORE = "antigenic_scores_map_visualization_monthly"
+THRESHOLD_STORE = "country_list_with_threshold_monthly"
+# Cumulative file (in the reference directory) and its separator that a new store is filled from
+CUMULATIVE_FILES = {MAP_STORE: ("antigenic_scores_map_visualization_cumulative.csv", ','),
+                    THRESHOLD_STORE: ("country_list_with_threshold.tsv", '\t')}
+
+def month_key(date):
+    # Function to return the sortable month (YYYY-MM) of a store date (MM-YYYY)
+    month, year = str(date).strip().split("-")
+    return (year + "-" + month)
+
+def read_manifest(store_path):
+    # Function to read the manifest of a store (empty if the store does not exist yet)
+    path = os.path.join(store_path, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return (pd.DataFrame(columns = MANIFEST_COLUMNS))
+    return (pd.read_csv(path, sep = '\t', dtype = {"date": str, "file": str, "rows": "int64"}))
+
+def write_manifest(manifest, store_path):
+    # Function to write the manifest of a store in month order, to a temporary file first so that an interrupted run keeps the old manifest
+    manifest = manifest.assign(key = manifest["date"].map(month_key)).sort_values("key").drop(columns = "key")
+    temporary_path = os.path.join(store_path, "." + MANIFEST_FILE + ".tmp")
+    manifest[MANIFEST_COLUMNS].to_csv(temporary_path, sep = '\t', index = False, header = True)
+    os.replace(temporary_path, os.path.join(store_path, MANIFEST_FILE))
+
+def write_partition(frame, store_path, date):
+    # Function to write the rows of one month to its partition file, returns the manifest row of the month
+    file_name = month_key(date) + ".tsv"
+    temporary_path = os.path.join(store_path, "." + file_name + ".tmp")
+    frame.to_csv(temporary_path, sep = '\t', index = False, header = True)
+    os.replace(temporary_path, os.path.join(store_path, file_name))
+    return ({"date": date, "file": file_name, "rows": len(frame)})
+
+def write_store_month(frame, store_path, date):
+    # Function to add (or replace) the rows of one month of a store, only the partition of the month and the manifest are written
+    os.makedirs(store_path, exist_ok = True)
+    manifest = read_manifest(store_path)
+    if manifest["date"].eq(date).any():
+        print("Replacing the month ", date, " in the store ", store_path)
+    month_row = write_partition(frame, store_path, date)
+    manifest = pd.concat([manifest[~manifest["date"].eq(date)], pd.DataFrame([month_row])], ignore_index = True)
+    write_manifest(manifest, store_path)
+    print("Store month saved: ", date, " (", len(frame), " rows)")
+
+def read_store(store_path, first = None, last = None):
+    # Function to read the rows of the months first to last (MM-YYYY, inclusive, all months if None) of a store in month order,
+    # only the partitions of these months are read
+    manifest = read_manifest(store_path)
+    keys = manifest["date"].map(month_key)
+    if first is not None:
+        manifest = manifest[(keys >= month_key(first)).values]
+    if last is not None:
+        manifest = manifest[(keys[manifest.index] <= month_key(last)).values]
+    if len(manifest) == 0:
+        return (pd.DataFrame())
+    months = [pd.read_csv(os.path.join(store_path, file_name), sep = '\t', float_precision = 'round_trip') for file_name in manifest["file"]]
+    return (pd.concat(months, ignore_index = True))
+
+def open_store(store_dir, store, reference_dir):
+    # Function to return the path of a store, a store that does not exist yet is filled from the cumulative file of the
+    # reference directory (one partition per date of the file) if there is one
+    store_path = os.path.join(store_dir, store)
+    cumulative_file, sep = CUMULATIVE_FILES[store]
+    cumulative_path = os.path.join(reference_dir, cumulative_file)
+    if len(read_manifest(store_path)) == 0 and os.path.exists(cumulative_path):
+        print("Filling the store ", store_path, " from ", cumulative_path)
+        os.makedirs(store_path, exist_ok = True)
+        df_cumulative = pd.read_csv(cumulative_path, sep = sep, dtype = {"date": str}, float_precision = 'round_trip')
+        month_rows = [write_partition(month_df, store_path, date) for date, month_df in df_cumulative.groupby("date", sort = False)]
+        write_manifest(pd.DataFrame(month_rows, columns = MANIFEST_COLUMNS), store_path)
+        print("Store months: ", len(month_rows))
+    return (store_path)
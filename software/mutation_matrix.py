@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Sparse scoring core shared by the variant_scoring_*.py scripts. The Spike substitutions of every
+# AA Substitutions profile are encoded as one row of a CSR matrix over a mutation vocabulary
+# (position, original aa, changed aa). The vocabulary is kept in a file next to the weights table so
+# that every mutation keeps the same integer id across runs and months. Scoring a weight table is then
+# a sparse matrix-vector product and the per lineage aggregates are sparse group sums.
+
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sparse
+from scoring_tables import aa_codes
+
+MUTATION_KEY = ['Substitution_Positions', 'Original_aa', 'Changed_aa']
+# Number of rows per partial aggregate, the partial sums are always added in row block order so that
+# the group sums do not depend on how the blocks were distributed over worker processes
+REDUCTION_BLOCK_ROWS = 100000
+VOCABULARY_COLUMNS = ['mutation_id'] + MUTATION_KEY
+
+def empty_vocabulary():
+    # Function to return a mutation vocabulary without mutations
+    return (pd.DataFrame(columns = VOCABULARY_COLUMNS).astype({'mutation_id': 'int64'}))
+
+def load_vocabulary(vocabulary_path):
+    # Function to read the mutation vocabulary, an empty vocabulary is returned if the file does not exist yet
+    if not os.path.isfile(vocabulary_path):
+        print("No mutation vocabulary found, creating a new one: ", vocabulary_path)
+        return (empty_vocabulary())
+    # Changed_aa is empty for stop codons, so empty strings are not converted to NaN
+    vocabulary = pd.read_csv(vocabulary_path, sep = '\t', dtype = str, na_filter = False).astype({'mutation_id': 'int64'})
+    print("Mutations in the vocabulary: ", len(vocabulary))
+    return (vocabulary)
+
+def update_vocabulary(vocabulary, tokens):
+    # Function to add the mutations that are not in the vocabulary yet (with new ids after the existing ones)
+    # and return the updated vocabulary and the mutation id of every token
+    keys = tokens[MUTATION_KEY].astype(str)
+    mutation_ids = keys.merge(vocabulary, how = 'left', on = MUTATION_KEY)['mutation_id']
+    new_mutations = keys[mutation_ids.isna().values].drop_duplicates()
+    if len(new_mutations) > 0:
+        new_mutations.insert(0, 'mutation_id', np.arange(len(vocabulary), len(vocabulary) + len(new_mutations)))
+        vocabulary = pd.concat([vocabulary, new_mutations], ignore_index = True)
+        mutation_ids = keys.merge(vocabulary, how = 'left', on = MUTATION_KEY)['mutation_id']
+    print("New mutations added to the vocabulary: ", len(new_mutations))
+    return (vocabulary, mutation_ids.values.astype('int64'))
+
+def save_vocabulary(vocabulary, vocabulary_path):
+    # Function to write the mutation vocabulary (to a temporary file first, so a crashed run cannot leave a partial vocabulary)
+    vocabulary[VOCABULARY_COLUMNS].to_csv(vocabulary_path + ".tmp", sep = '\t', index = False, header = True)
+    os.replace(vocabulary_path + ".tmp", vocabulary_path)
+
+def build_mutation_matrix(row_ids, mutation_ids, n_rows, n_mutations):
+    # Function to build the CSR matrix (rows x mutations) from the row and mutation id of every token,
+    # the tokens of a row keep their order so that the row sums are added up in the order of the substitutions
+    order = np.argsort(row_ids, kind = 'stable')
+    indptr = np.zeros(n_rows + 1, dtype = 'int64')
+    np.cumsum(np.bincount(row_ids, minlength = n_rows), out = indptr[1:])
+    data = np.ones(len(order), dtype = 'float64')
+    return (sparse.csr_matrix((data, np.asarray(mutation_ids)[order], indptr), shape = (n_rows, n_mutations)))
+
+def mutation_weights(vocabulary, weight_matrix):
+    # Function to return the weight of every mutation in the vocabulary (by mutation id) from a compiled amino acid
+    # weight array (see scoring_tables.aa_weight_matrix), mutations that are not in the weights table have weight 0
+    return (weight_matrix[aa_codes(vocabulary['Original_aa'].values), aa_codes(vocabulary['Changed_aa'].values)])
+
+def score_matrix(mutation_matrix, weight_vector):
+    # Function to return the score of every row of the mutation matrix for the given mutation weights. The weights of a row are
+    # summed in mutation (column) order, not in the order of the substitutions of the profile like the per-sequence groupby sum
+    # of the original scripts, so the scores equal the original ones within float tolerance (about 1e-16 relative), not bit for bit
+    return (mutation_matrix.dot(weight_vector))
+
+def group_sums(group_codes, values, n_groups):
+    # Function to return the sum of the values of every group as a sparse (groups x rows) indicator product
+    indicator = sparse.csr_matrix((np.ones(len(group_codes)), (group_codes, np.arange(len(group_codes)))), shape = (n_groups, len(group_codes)))
+    return (indicator.dot(values))
+
+def group_partials(group_codes, values, n_groups):
+    # Function to return the partial aggregates (sum and count of the values of every group) of a block of rows
+    return (group_sums(group_codes, values, n_groups), np.bincount(group_codes, minlength = n_groups))
+
+def merge_group_partials(partials, n_groups):
+    # Function to merge the partial aggregates of consecutive row blocks (in block order) into the group sums and counts
+    sums = np.zeros(n_groups, dtype = 'float64')
+    counts = np.zeros(n_groups, dtype = 'int64')
+    for block_number, (block_sums, block_counts) in enumerate(partials):
+        sums = block_sums if block_number == 0 else sums + block_sums
+        counts = counts + block_counts
+    return (sums, counts)
+
+def row_blocks(n_rows):
+    # Function to return the (start, stop) rows of the reduction blocks
+    return ([(start, min(start + REDUCTION_BLOCK_ROWS, n_rows)) for start in range(0, n_rows, REDUCTION_BLOCK_ROWS)])
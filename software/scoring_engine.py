@@ -0,0 +1,677 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Scoring engine shared by the variant_scoring_*.py scripts. The scripts only differ in their scoring
+# strategy, which is the combination of a site mask (all spike sites or only the true positive antigenic
+# sites), a weight table (the amino acid weights, or a weight of 1 for every amino acid change) and
+# whether the weights are reversible. The metadata is read, tokenized and encoded as a mutation matrix
+# once, and every requested strategy is then only a different weight vector for the same matrix.
+#
+# With a single strategy the results are written to the output directory as before. With several
+# strategies (variant_scoring_methods.py) every strategy gets its own sub directory and the per-sequence
+# weights and lineage ranks of all strategies are additionally written side by side.
+#
+# With --jobs N the profiles are scored in N worker processes (in shards, the profile weights and new
+# mutations of the shards are merged in shard order) and the lineage aggregates and the cube of all strategies are merged
+# from the partial aggregates of fixed row blocks, so the results are identical to a serial run. The small country and
+# region aggregations are calculated in the parent process. The profiles,
+# the weight tables, the tp site mask and the aggregated columns are shared with the workers through shared
+# memory (shared_arrays.py), so the memory use stays flat when the number of workers grows.
+#
+# The lineage and country scores are calculated from the lineage codes and weights of the sequences, the per-sequence
+# output rows are only built in batches while they are written (write_sequence_scores), so no merged copy of the month is held.
+# The continent, country and region scores are rolled up from one aggregation per distinct (continent, country, region).
+
+import os.path
+import sys
+import multiprocessing
+import datetime
+from time import process_time
+from datetime import date
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from dateutil.relativedelta import relativedelta
+from metadata_reader import read_monthly_metadata, month_range, month_code, month_name, month_index, month_rows, compact_accession_ids, readable_metadata
+from substitution_tokenizer import tokenize_substitutions
+from substitution_profiles import factorize_profiles, broadcast_profile_weights
+from mutation_matrix import MUTATION_KEY, empty_vocabulary, load_vocabulary, update_vocabulary, save_vocabulary, build_mutation_matrix, mutation_weights, score_matrix, group_partials, merge_group_partials, row_blocks
+from batch_engine import DEFAULT_MAX_MEMORY, parse_memory_size, batch_rows, process_batches
+from scoring_tables import tp_site_bitset, at_tp_sites, aa_weight_matrix, reversible_weight_matrix
+from weight_store import weights_fingerprint, load_weight_store, split_by_store, save_weight_store
+from exclusion_set import exclusion_array, update_exclusion_set
+from sequence_scores import DEFAULT_OUTPUT_FORMAT, DEFAULT_OUTPUT_LAYOUT, output_format, output_layout, write_sequence_scores, write_normalized_scores
+from aggregate_cube import CUBE_KEYS, write_cube
+from location_parser import DEFAULT_LOCATION_CACHE, parse_locations
+from cli_options import pop_option
+from shared_arrays import share_array, attach_array, share_strings, shared_strings, with_shared_arrays, release_arrays
+
+DEFAULT_WEIGHTS = "antigenic_weights.csv"
+# Number of earlier months that are tried (latest first) when the analysis month has no data
+FALLBACK_MONTHS = 2
+# Metadata columns of the per-sequence scores (antigenic_scores_all), followed by the Weight and antigenic_score of the sequence
+SEQUENCE_COLUMNS = ["Accession ID", "Collection date", "Location", "Pango lineage", "AA Substitutions"]
+# Location hierarchy of the geography scores (antigenic_scores_geography.csv), the country ISO alpha-2 code is added to the country and region rows
+GEOGRAPHY_LEVELS = ["Continent", "Country", "Region"]
+GEOGRAPHY_COLUMNS = GEOGRAPHY_LEVELS + ["ISO2"]
+# sites: "all" spike sites or only the true positive "antigenic" sites (every substitution is counted once per sequence)
+# weights: file name of the weight table in the reference directory, None for a weight of 1 for every amino acid change
+# reversible: amino acid changes that are not in the weight table get the weight of the reversed change
+# significance: the ranked table also has the lineage frequency, zscore and significance (CoVerage pipeline)
+STRATEGIES = {
+    'weights_at_antigenic_sites': {'sites': 'antigenic', 'weights': DEFAULT_WEIGHTS, 'reversible': False, 'significance': False},
+    'weights_at_all_sites': {'sites': 'all', 'weights': DEFAULT_WEIGHTS, 'reversible': False, 'significance': True},
+    'all_sites_new_weights': {'sites': 'all', 'weights': "antigenic_weights_higher_threshold.csv", 'reversible': False, 'significance': False},
+    'all_sites_reversible_weights': {'sites': 'all', 'weights': DEFAULT_WEIGHTS, 'reversible': True, 'significance': False},
+    'noweights_all_sites': {'sites': 'all', 'weights': None, 'reversible': False, 'significance': False},
+    'without_weights_at_antigenic_sites': {'sites': 'antigenic', 'weights': None, 'reversible': False, 'significance': False},
+}
+
+def strategy_weight_paths(strategy_names, weights_path):
+    # Function to return the weight table file of every strategy (None for the strategies without weights). A single
+    # strategy uses the given weight table, several strategies take their other weight tables from the same directory
+    reference_dir = os.path.dirname(os.path.abspath(weights_path))
+    weight_paths = {}
+    for name in strategy_names:
+        table = STRATEGIES[name]['weights']
+        if table is None:
+            weight_paths[name] = None
+        elif len(strategy_names) == 1 or table == DEFAULT_WEIGHTS:
+            weight_paths[name] = weights_path
+        else:
+            weight_paths[name] = os.path.join(reference_dir, table)
+    return (weight_paths)
+
+def strategy_weight_tables(strategy_names, weight_paths):
+    # Function to compile the amino acid weight array of every strategy (None for the strategies without weights)
+    weight_tables = {}
+    for name in strategy_names:
+        if weight_paths[name] is None:
+            weight_tables[name] = None
+            continue
+        print("Weights of ", name, ": ", weight_paths[name])
+        weights = pd.read_csv(weight_paths[name], sep = '\t')
+        weight_tables[name] = reversible_weight_matrix(weights) if STRATEGIES[name]['reversible'] else aa_weight_matrix(weights)
+    return (weight_tables)
+
+def analysis_month(argv):
+    # Function to return the month and year (MM, YYYY) of the analysis, either given by the user or the previous month
+    print("Getting most recent month")
+    if len(argv) == 9:
+        print("Using user input month and year settings")
+        # Using a predetermined month and year for the analysis that the user inputs
+        max_month = str(argv[7])
+        max_year = str(argv[8])
+        print("MONTH: ", max_month)
+        print("YEAR: ", max_year)
+    elif len(argv) == 7:
+        # Calculating the most recent whole month and year based on today's date
+        today = date.today()
+        max_month = str((today - relativedelta(months = 1)).month)
+        max_year = str((today - relativedelta(months = 1)).year)
+        if len(max_month) < 2:
+            max_month = "0" + str(max_month)
+        print("Previous Month and Year:")
+        print(max_year)
+        print(max_month, "\n")
+    else:
+        print("Wrong number of arguments, please use -h for more information")
+        sys.exit(1)
+    return (max_month, max_year)
+
+def read_analysis_metadata(metadata_path, output, max_month, max_year, exclusion):
+    # Function to read the metadata of the analysis month, falling back to the latest of the FALLBACK_MONTHS earlier months
+    # that has data (the skipped months are written to month_remove.txt), returns the metadata and the month and year that were used
+    target = month_code(max_year + '-' + max_month)
+    window = [target - months_back for months_back in range(FALLBACK_MONTHS + 1)]
+    # Reading all months of the fallback window in a single pass and indexing the rows by their collection month
+    window_metadata = read_monthly_metadata(metadata_path, [month_name(code) for code in window], exclusion)
+    index = month_index(window_metadata['Collection date'])
+    used = next((code for code in window if len(month_rows(index, code)) > 0), None)
+    skipped = window if used is None else window[:window.index(used)]
+    if len(skipped) > 0:
+        print("No isolate data for: ", ", ".join(month_name(code) for code in skipped))
+        # Making file to remove months from month file, used later for frequency heatmap
+        today = date.today()
+        month_remove_file = open(output + "month_remove.txt", "w")
+        month_remove_file.writelines(str(today.year) + "-" + "{:02d}".format(today.month))
+        for code in skipped:
+            month_remove_file.writelines("\n" + month_name(code))
+        month_remove_file.close()
+    # Throwing error if none of the months of the fallback window has data
+    if used is None:
+        print("ERROR - despite using data from ", FALLBACK_MONTHS, " months earlier, the monthly_metadata file is still empty, please check!")
+        sys.exit()
+    max_year, max_month = month_name(used).split("-")
+    print("Using data from: ", max_month, "-", max_year)
+    monthly_metadata = window_metadata.iloc[month_rows(index, used)].reset_index(drop = True)
+    print("Length of monthly_metadata: ", len(monthly_metadata))
+    print(monthly_metadata.head())
+    return (monthly_metadata, max_month, max_year)
+
+def substitution_tokens(input_df):
+    # Function to split the AA Substitutions of each profile into one row per spike substitution (position, original and changed aa)
+    print("Converting AA Substitutions and Positions")
+    tokens = tokenize_substitutions(input_df['AA Substitutions'])
+    tokens['profile_id'] = input_df['profile_id'].values[tokens['row'].values]
+    print("substitution tokens complete")
+    return (tokens)
+
+def profile_tokens(profiles_df, max_memory):
+    # Function to return the spike substitutions of the profiles, tokenized in memory budgeted batches
+    print("Length of Profiles File to be processed: ", len(profiles_df))
+    print("Tokenizing Substitutions")
+    token_df_list = process_batches(profiles_df, substitution_tokens, max_memory, skip_errors = True)
+    return (pd.concat(token_df_list) if len(token_df_list) > 0 else pd.DataFrame(columns = ['profile_id', 'Substitution_Positions', 'Original_aa', 'Changed_aa']))
+
+def strategy_profile_weights(profile_ids, mutation_ids, vocabulary, n_profiles, strategy_names, weight_tables, tp_bitset):
+    # Function to return the weight of every profile for every strategy, the substitutions are encoded as a
+    # mutation matrix (profiles x vocabulary) once and each strategy is a weight vector over the mutation vocabulary
+    matrices = {'all': build_mutation_matrix(profile_ids, mutation_ids, n_profiles, len(vocabulary))}
+    print("Mutation matrix shape: ", matrices['all'].shape, ", non zero entries: ", matrices['all'].nnz)
+    if any(STRATEGIES[name]['sites'] == 'antigenic' for name in strategy_names):
+        # At the antigenic sites a substitution that is listed more than once for a sequence is only counted once
+        first_tokens = ~pd.DataFrame({'profile_id': profile_ids, 'mutation_id': mutation_ids}).duplicated().values
+        matrices['antigenic'] = build_mutation_matrix(profile_ids[first_tokens], mutation_ids[first_tokens], n_profiles, len(vocabulary))
+        tp_mask = at_tp_sites(vocabulary['Substitution_Positions'].values, tp_bitset)
+    profile_weights = {}
+    for name in strategy_names:
+        strategy = STRATEGIES[name]
+        # Strategies without a weight table give every substitution the same weight (1)
+        weight_vector = np.ones(len(vocabulary)) if weight_tables[name] is None else mutation_weights(vocabulary, weight_tables[name])
+        if strategy['sites'] == 'antigenic':
+            weight_vector = np.where(tp_mask, weight_vector, 0.0)
+        profile_weights[name] = score_matrix(matrices[strategy['sites']], weight_vector)
+    return (profile_weights)
+
+# Scoring settings of the worker processes (set once per process by init_scoring_worker)
+WORKER_CONTEXT = {}
+
+def init_scoring_worker(context, table_descriptors):
+    # Function to set the scoring settings (strategies and memory budget) of a worker process and attach to the shared
+    # weight tables and tp site mask, the attached blocks are kept open for the lifetime of the worker
+    WORKER_CONTEXT.update(context)
+    attached = {name: attach_array(descriptor) for name, descriptor in table_descriptors.items() if descriptor is not None}
+    WORKER_CONTEXT['shared_blocks'] = [block for block, _ in attached.values()]
+    WORKER_CONTEXT['tp_bitset'] = attached.pop('tp_bitset')[1]
+    WORKER_CONTEXT['weight_tables'] = {name: attached[name][1] if name in attached else None for name in context['strategy_names']}
+
+def score_profile_shard(profile_descriptors, start, stop):
+    # Function (run in a worker process) to score the profiles start to stop (read from the shared profiles) with a local mutation
+    # vocabulary, returns the profile weights of every strategy and the mutations of the shard (for the persistent vocabulary)
+    shard = pd.DataFrame({'profile_id': np.arange(start, stop, dtype = 'int64'), 'AA Substitutions': shared_strings(profile_descriptors, start, stop)})
+    tokens_df = profile_tokens(shard, WORKER_CONTEXT['max_memory'])
+    vocabulary, mutation_ids = update_vocabulary(empty_vocabulary(), tokens_df)
+    profile_ids = tokens_df['profile_id'].values.astype('int64') - start
+    profile_weights = strategy_profile_weights(profile_ids, mutation_ids, vocabulary, len(shard), WORKER_CONTEXT['strategy_names'], WORKER_CONTEXT['weight_tables'], WORKER_CONTEXT['tp_bitset'])
+    return (profile_weights, vocabulary[MUTATION_KEY])
+
+def scoring_pool(jobs, strategy_names, weight_tables, tp_bitset, max_memory):
+    # Function to start the worker processes of the parallel mode (None for a serial run), the weight tables and the tp site
+    # mask are shared read only with the workers, returns the pool and the shared blocks (to be released after the pool is joined)
+    if jobs <= 1:
+        return (None, [])
+    print("Starting ", jobs, " worker processes")
+    shared = {name: share_array(table) for name, table in weight_tables.items() if table is not None}
+    shared['tp_bitset'] = share_array(tp_bitset)
+    table_descriptors = {name: descriptor for name, (_, descriptor) in shared.items()}
+    context = {'strategy_names': strategy_names, 'max_memory': max(max_memory // jobs, 1)}
+    pool = multiprocessing.Pool(jobs, initializer = init_scoring_worker, initargs = (context, table_descriptors))
+    return (pool, [block for block, _ in shared.values()])
+
+def score_profiles(profiles_df, strategy_names, weight_tables, tp_bitset, vocabulary_path, max_memory, pool = None, jobs = 1):
+    # Function to return the weight of every profile for every strategy and add the new mutations to the persistent vocabulary
+    vocabulary = load_vocabulary(vocabulary_path)
+    if pool is None:
+        tokens_df = profile_tokens(profiles_df, max_memory)
+        # Encoding the substitutions of every profile as a row of the sparse mutation matrix (stable mutation ids from the vocabulary)
+        vocabulary, mutation_ids = update_vocabulary(vocabulary, tokens_df)
+        save_vocabulary(vocabulary, vocabulary_path)
+        return (strategy_profile_weights(tokens_df['profile_id'].values.astype('int64'), mutation_ids, vocabulary, len(profiles_df), strategy_names, weight_tables, tp_bitset))
+    # The profiles are shared with the workers once, the tasks only pass the profile range of their shard. The profile strings are
+    # shared (not the tokenized positions and aa codes) because the tokenizing and the vocabulary lookup are nearly all of the work
+    # of a profile (the mutation matrix product is cheap), so they are what the workers run in parallel
+    blocks, profile_descriptors = share_strings(profiles_df['AA Substitutions'].to_list())
+    # Several (consecutive) shards per worker process so that the workers are evenly loaded
+    shard_bounds = np.linspace(0, len(profiles_df), min(jobs * 4, max(len(profiles_df), 1)) + 1).astype('int64')
+    shards = [(profile_descriptors, start, stop) for start, stop in zip(shard_bounds[:-1], shard_bounds[1:])]
+    print("Scoring ", len(profiles_df), " profiles in ", len(shards), " shards")
+    try:
+        shard_results = pool.starmap(score_profile_shard, shards)
+    finally:
+        release_arrays(blocks)
+    vocabulary, _ = update_vocabulary(vocabulary, pd.concat([mutations for _, mutations in shard_results]))
+    save_vocabulary(vocabulary, vocabulary_path)
+    return ({name: np.concatenate([weights[name] for weights, _ in shard_results]) for name in strategy_names})
+
+def shared_group_partials(descriptors, start, stop, n_groups):
+    # Function (run in a worker process) to return the partial aggregates of the rows start to stop of the shared group codes and values
+    return (with_shared_arrays(descriptors, lambda group_codes, values: group_partials(group_codes[start:stop], values[start:stop], n_groups)))
+
+def group_aggregates(group_codes, values, n_groups, pool = None):
+    # Function to return the sum and count of the values of every group (values of one or several columns, rows x columns), merged
+    # from the partial aggregates of the row blocks. In the parallel mode the group codes and all value columns are shared once and
+    # the blocks are aggregated by the worker processes, the rows of a single block are aggregated in the parent process
+    blocks = row_blocks(len(group_codes))
+    if pool is None or len(blocks) < 2:
+        partials = [group_partials(group_codes[start:stop], values[start:stop], n_groups) for start, stop in blocks]
+        return (merge_group_partials(partials, n_groups))
+    shared = [share_array(group_codes), share_array(values)]
+    descriptors = [descriptor for _, descriptor in shared]
+    try:
+        partials = pool.starmap(shared_group_partials, [(descriptors, start, stop, n_groups) for start, stop in blocks])
+    finally:
+        release_arrays([block for block, _ in shared])
+    return (merge_group_partials(partials, n_groups))
+
+def lineage_aggregates(df, weight_columns, pool = None):
+    # Function to return the lineage code of every sequence and the lineage table of every weight column (the lineages in order of
+    # appearance with their antigenic score, the average weight of their sequences, and their number of sequences) from the lineage
+    # sums and counts, the weights of all strategies are aggregated in one pass over the shared lineage codes
+    lineage_codes, lineages = pd.factorize(df['Pango lineage'])
+    lineage_sums, lineage_counts = group_aggregates(lineage_codes, df[weight_columns].values, len(lineages), pool)
+    lineage_dfs = {}
+    for column_number, weight_column in enumerate(weight_columns):
+        lineage_dfs[weight_column] = pd.DataFrame({'Pango lineage': np.asarray(lineages, dtype = object), 'antigenic_score': lineage_sums[:, column_number] / lineage_counts, 'count': lineage_counts})
+    return (lineage_codes, lineage_dfs)
+
+def rank_lineages(lineage_df, n_sequences, voc_df, significance):
+    # Function to rank the pango lineages of the lineage table by their antigenic score and add the WHO labels, with significance
+    # the global frequency (of the n_sequences sequences), zscore and significance of the lineages are added as well
+    if not significance:
+        # Ranking pango lineages based on average mutation score across all the sequences
+        df_ranked = lineage_df[["Pango lineage", "antigenic_score"]]
+        df_ranked = df_ranked.dropna(axis=0)
+        df_ranked.sort_values(by=['antigenic_score'], ascending=False, inplace=True)
+        df_ranked.reset_index(inplace=True)
+        df_ranked["rank"] = df_ranked['antigenic_score'].rank(ascending=False)
+        df_ranked = df_ranked[["Pango lineage", "antigenic_score", "rank"]]
+        df_merged_ranked = df_ranked.merge(voc_df, how="left", on="Pango lineage")
+        df_merged_ranked['WHO_label'] = df_merged_ranked['WHO_label'].fillna("Non Variant of Concern")
+        return (df_merged_ranked)
+    # Calculating global frequency of lineages
+    df_final_freq = lineage_df[["Pango lineage", "antigenic_score", "count"]].copy()
+    print("df_final_freq: ")
+    print(pd.DataFrame.head(df_final_freq))
+    df_final_freq["frequency"] = df_final_freq["count"] / n_sequences
+    # Ranking pango lineages based on average mutation score across all sequences
+    df_ranked = df_final_freq[["Pango lineage", "antigenic_score", "frequency"]]
+    df_ranked = df_ranked.dropna(axis=0)
+    df_ranked.sort_values(by=['antigenic_score'], ascending=False, inplace=True)
+    df_ranked.reset_index(inplace=True)
+    df_ranked["rank"] = df_ranked['antigenic_score'].rank(ascending=False)
+    df_ranked = df_ranked[["Pango lineage", "antigenic_score", "rank", "frequency"]]
+    df_merged_ranked = df_ranked.merge(voc_df, how="left", on="Pango lineage")
+    df_merged_ranked['WHO_label'] = df_merged_ranked['WHO_label'].fillna("Non Variant of Concern")
+    print("After WHO label: ")
+    print(pd.DataFrame.head(df_merged_ranked))
+    # Calculating zscores to identify lineages that are antigenically altered for the month
+    print("length of lineages prior to frequency filtration: ", len(df_merged_ranked))
+    antigenic_temp_df_filtered = df_merged_ranked[df_merged_ranked["frequency"] >= 0.001]
+    print("length after frequency filtration: ", len(df_merged_ranked))
+    zscores = stats.zscore(antigenic_temp_df_filtered["antigenic_score"])
+    antigenic_temp_df_filtered["zscore"] = zscores
+    df_merged_ranked = pd.merge(df_merged_ranked, antigenic_temp_df_filtered, how = "left", on = ["Pango lineage", "antigenic_score", "rank", "frequency", "WHO_label"])
+    print("with zscores: ")
+    print(pd.DataFrame.head(df_merged_ranked))
+    # Marking significantly altered lineages
+    df_merged_ranked["significant"] = np.where(df_merged_ranked["zscore"] >= 1, "yes", "no")
+    print("with significance: ")
+    print(pd.DataFrame.head(df_merged_ranked))
+    return (df_merged_ranked)
+
+def add_location_regions(metadata, cache_path = None):
+    # Function to add the continent, country, region and country ISO code of every sequence (categorical columns) from the parsed distinct locations
+    locations = parse_locations(metadata['Location'].cat.categories, cache_path)
+    location_codes = metadata['Location'].cat.codes.values
+    for part in GEOGRAPHY_COLUMNS:
+        region_codes, regions = pd.factorize(locations[part].values)
+        metadata[part] = pd.Categorical.from_codes(np.append(region_codes, -1)[location_codes], categories = regions)
+    return (metadata)
+
+def map_visualization(df, lineage_codes, lineage_df):
+    # Function to calculate the antigenic score per country for the global map visualization from the per country and per
+    # country and lineage sequence counts, only the (few) country and lineage combinations are held as a table
+    # The continent and country of the sequences are taken from their codes (add_location_regions)
+    continents = df['Continent'].cat.categories
+    countries = df['Country'].cat.categories
+    keep = (df['Pango lineage'] != 'None').values
+    sequence_lineages = lineage_codes[keep].astype('int64')
+    sequence_continents = df['Continent'].cat.codes.values[keep].astype('int64')
+    sequence_countries = df['Country'].cat.codes.values[keep].astype('int64')
+
+    # Calculating the frequency for each lineage per country (from the per country and per country and lineage counts):
+    n_lineage_codes = len(lineage_df)
+    country_lineage_codes, country_lineages = pd.factorize(sequence_countries * n_lineage_codes + sequence_lineages)
+    country_index, country_list = pd.factorize(sequence_countries)
+    # The counts are cheap bincounts of the parent process (not worth the shared memory and dispatch of the worker processes)
+    n_lineages = np.bincount(country_lineage_codes, minlength = len(country_lineages))
+    total_lineages = np.bincount(country_index, minlength = len(country_list))
+    frequency = pd.Series(n_lineages[country_lineage_codes]).div(pd.Series(total_lineages[country_index])).values
+
+    # One row per lineage, continent and country (in order of appearance) with the average antigenic score of the lineage:
+    combination_codes, combinations = pd.factorize((sequence_continents * (len(countries) + 1) + sequence_countries) * n_lineage_codes + sequence_lineages)
+    _, first_rows = np.unique(combination_codes, return_index = True)
+    first_lineages = sequence_lineages[first_rows]
+    df_vis_threshold_averaged = pd.DataFrame({'Pango lineage': lineage_df['Pango lineage'].values[first_lineages],
+                                              'antigenic_score': lineage_df['antigenic_score'].values[first_lineages],
+                                              'Continent': region_names(continents, sequence_continents[first_rows]),
+                                              'Country': region_names(countries, sequence_countries[first_rows]),
+                                              'frequency': frequency[first_rows]})
+
+    # Calculating antigenic score per country:
+    df_vis_threshold_averaged['score'] = df_vis_threshold_averaged['antigenic_score'] * df_vis_threshold_averaged[
+        'frequency']
+    df_vis_threshold_averaged['country_score'] = df_vis_threshold_averaged.groupby('Country', observed=True)['score'].transform('sum')
+    df = df_vis_threshold_averaged.drop(['Pango lineage', 'frequency', 'antigenic_score', 'score'], axis=1, )
+    df.drop_duplicates(inplace=True)
+    return (df)
+
+def geography_scores(df, lineage_codes, lineage_df):
+    # Function to calculate the antigenic score (sum of lineage antigenic score * lineage frequency, ie. the average lineage score of
+    # the sequences) of every continent, country and region. The sequences are aggregated once per distinct (continent, country, region)
+    # and the countries and continents are rolled up from these few partial sums
+    keep = (df['Pango lineage'] != 'None').values
+    sequence_codes = {column: df[column].cat.codes.values[keep].astype('int64') for column in GEOGRAPHY_COLUMNS}
+    area_key = np.zeros(keep.sum(), dtype = 'int64')
+    for level in GEOGRAPHY_LEVELS:
+        area_key = area_key * (len(df[level].cat.categories) + 1) + sequence_codes[level] + 1
+    area_codes, areas = pd.factorize(area_key)
+    lineage_scores = lineage_df['antigenic_score'].values[lineage_codes[keep]]
+    area_sums, area_counts = group_aggregates(area_codes, lineage_scores, len(areas))
+    _, first_rows = np.unique(area_codes, return_index = True)
+    area_df = pd.DataFrame({column: region_names(df[column].cat.categories, sequence_codes[column][first_rows]) for column in GEOGRAPHY_COLUMNS})
+    area_df['sum'] = area_sums
+    area_df['sequences'] = area_counts
+    # Rolling up the regions to their country and the countries to their continent
+    levels = []
+    for depth, level in enumerate(GEOGRAPHY_LEVELS, start = 1):
+        level_columns = GEOGRAPHY_LEVELS[:depth] + (["ISO2"] if depth > 1 else [])
+        level_df = area_df[area_df[level].notna()].groupby(level_columns, dropna = False)[['sum', 'sequences']].sum().reset_index()
+        level_df.insert(0, 'level', level.lower())
+        levels.append(level_df)
+    geography_df = pd.concat(levels, ignore_index = True)[['level'] + GEOGRAPHY_COLUMNS + ['sequences', 'sum']]
+    geography_df['score'] = geography_df['sum'] / geography_df['sequences']
+    return (geography_df.drop(columns = ['sum']))
+
+def cube_aggregates(df, weight_columns, pool = None):
+    # Function to return the daily aggregate cube of the scored sequences of every weight column, one entry per (collection date, location,
+    # lineage) with the number of sequences and the sum and sum of squares of their weights (aggregated once over the distinct combinations,
+    # the weights and squared weights of all strategies in one pass over the shared entry codes)
+    date_codes, _ = pd.factorize(df['Collection date'])
+    key = date_codes.astype('int64')
+    for column in ('Location', 'Pango lineage'):
+        key = key * (len(df[column].cat.categories) + 1) + df[column].cat.codes.values.astype('int64') + 1
+    entry_codes, entries = pd.factorize(key)
+    weights = df[weight_columns].values
+    sums, counts = group_aggregates(entry_codes, np.concatenate([weights, weights * weights], axis = 1), len(entries), pool)
+    _, first_rows = np.unique(entry_codes, return_index = True)
+    entry_keys = readable_metadata(df[CUBE_KEYS].iloc[first_rows].reset_index(drop = True)).astype(object)
+    cubes = {}
+    for column_number, weight_column in enumerate(weight_columns):
+        cube = entry_keys.copy()
+        cube['sequences'] = counts.astype('int64')
+        cube['weight_sum'] = sums[:, column_number]
+        cube['weight_sumsq'] = sums[:, len(weight_columns) + column_number]
+        cubes[weight_column] = cube.sort_values(CUBE_KEYS, ignore_index = True)
+    return (cubes)
+
+def region_names(regions, region_codes):
+    # Function to return the region name of every region code (NaN for the code -1 of a location without that part)
+    return (np.append(np.asarray(regions, dtype = object), np.nan)[region_codes])
+
+def sequence_batches(df, columns, score_columns, max_memory):
+    # Function to yield the per-sequence output table in memory budgeted batches of readable rows, the metadata columns are
+    # taken from the rows of df and every score column is a function returning its values for the rows start to stop
+    rows = batch_rows(df, max_memory)
+    for start in range(0, max(len(df), 1), rows):
+        batch = df.iloc[start:start + rows][columns]
+        batch = batch.assign(**{name: values(start, start + len(batch)) for name, values in score_columns.items()})
+        yield (readable_metadata(batch))
+
+def factorize_values(values):
+    # Function to return the code of every value and the distinct values (object array), missing values get a code of their own
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype = object)
+    if (codes < 0).any():
+        codes = np.where(codes < 0, len(uniques), codes)
+        uniques = np.append(uniques, np.nan)
+    return (codes, uniques)
+
+def write_normalized_results(df, weights, lineage_codes, lineage_df, output, max_memory, scores_format = DEFAULT_OUTPUT_FORMAT):
+    # Function to write the per-sequence scores of one month in the normalized layout, the distinct locations, lineages (with
+    # their antigenic score) and profiles (AA Substitutions with their weight) once and the codes of every sequence in batches
+    location_codes, locations = factorize_values(df['Location'])
+    substitution_codes, substitutions = factorize_values(df['AA Substitutions'])
+    # A profile is an AA Substitutions string with its weight (the weights of the incremental mode come from the weight store)
+    profile_codes, profiles = pd.MultiIndex.from_arrays([substitution_codes, weights]).factorize()
+    tables = {'locations': pd.DataFrame({'location_code': np.arange(len(locations)), 'Location': locations}),
+              'lineages': pd.DataFrame({'lineage_code': np.arange(len(lineage_df)), 'Pango lineage': lineage_df['Pango lineage'].values,
+                                        'antigenic_score': lineage_df['antigenic_score'].values}),
+              'profiles': pd.DataFrame({'profile_id': np.arange(len(profiles)),
+                                        'AA Substitutions': substitutions[profiles.get_level_values(0)],
+                                        'Weight': profiles.get_level_values(1).values})}
+    print("Distinct profiles: ", len(profiles), ", lineages: ", len(lineage_df), ", locations: ", len(locations))
+    write_normalized_scores(sequence_batches(df, ["Accession ID", "Collection date"], {'location_code': lambda start, stop: location_codes[start:stop],
+                                                                                         'lineage_code': lambda start, stop: lineage_codes[start:stop],
+                                                                                         'profile_id': lambda start, stop: profile_codes[start:stop]}, max_memory),
+                            tables, output, scores_format)
+
+def write_results(df, weight_column, lineage_codes, lineage_df, output, voc_df, significance, max_memory, scores_format = DEFAULT_OUTPUT_FORMAT, scores_layout = DEFAULT_OUTPUT_LAYOUT):
+    # Function to write the results files of one month of scored sequences (weights in weight_column, lineage codes and lineage table
+    # from lineage_aggregates) to the output directory, the per-sequence rows are streamed to the output file in batches. Returns the
+    # ranked table
+    print("Creating final dataframe...")
+    weights = df[weight_column].values
+    lineage_scores = lineage_df['antigenic_score'].values
+
+    print("Saving dataframe...")
+    if scores_layout == "normalized":
+        write_normalized_results(df, weights, lineage_codes, lineage_df, output, max_memory, scores_format)
+    else:
+        write_sequence_scores(sequence_batches(df, SEQUENCE_COLUMNS, {'Weight': lambda start, stop: weights[start:stop],
+                                                                      'antigenic_score': lambda start, stop: lineage_scores[lineage_codes[start:stop]]}, max_memory), output, scores_format)
+
+    df_merged_ranked = rank_lineages(lineage_df, len(df), voc_df, significance)
+    df_merged_ranked.to_csv(output + "antigenic_scores_ranked_with_WHO.csv", sep='\t', index=False, header=True)
+    print("Ranked Antigenic Scores COMPLETE")
+
+    # Saving visualization dataframe:
+    map_visualization(df, lineage_codes, lineage_df).to_csv(output + "antigenic_scores_map_visualization.csv", sep='\t', index=False, header=True)
+    # Saving the scores of the continents, countries and regions:
+    geography_scores(df, lineage_codes, lineage_df).to_csv(output + "antigenic_scores_geography.csv", sep='\t', index=False, header=True)
+    return (df_merged_ranked)
+
+def write_month_results(df, output, strategy_names, voc_df, max_memory, pool = None, scores_format = DEFAULT_OUTPUT_FORMAT, scores_layout = DEFAULT_OUTPUT_LAYOUT):
+    # Function to write the results of every strategy for one month, with several strategies each one is written to
+    # its own sub directory and the weights and ranks of all strategies are written side by side to the output directory
+    # Calculating final antigenic score by averaging the scores across the lineages (all strategies in one pass)
+    lineage_codes, lineage_dfs = lineage_aggregates(df, strategy_names, pool)
+    if len(strategy_names) == 1:
+        write_results(df, strategy_names[0], lineage_codes, lineage_dfs[strategy_names[0]], output, voc_df, STRATEGIES[strategy_names[0]]['significance'], max_memory, scores_format, scores_layout)
+        return
+    score_columns = {}
+    ranked_by_strategy = None
+    for name in strategy_names:
+        print("\nWriting results of strategy: ", name)
+        strategy_output = os.path.join(output, name) + "/"
+        os.makedirs(strategy_output, exist_ok = True)
+        df_merged_ranked = write_results(df, name, lineage_codes, lineage_dfs[name], strategy_output, voc_df, STRATEGIES[name]['significance'], max_memory, scores_format, scores_layout)
+        weights = df[name].values
+        lineage_scores = lineage_dfs[name]['antigenic_score'].values
+        score_columns[name + "_Weight"] = lambda start, stop, weights = weights: weights[start:stop]
+        score_columns[name + "_antigenic_score"] = lambda start, stop, scores = lineage_scores: scores[lineage_codes[start:stop]]
+        ranks = df_merged_ranked[["Pango lineage", "WHO_label", "antigenic_score", "rank"]].rename(columns = {"antigenic_score": name + "_antigenic_score", "rank": name + "_rank"})
+        ranked_by_strategy = ranks if ranked_by_strategy is None else ranked_by_strategy.merge(ranks, how = "outer", on = ["Pango lineage", "WHO_label"])
+    write_sequence_scores(sequence_batches(df, ["Accession ID", "Collection date", "Location", "Pango lineage"], score_columns, max_memory), output, scores_format, "antigenic_scores_all_strategies")
+    ranked_by_strategy.to_csv(output + "antigenic_scores_ranked_all_strategies.csv", sep='\t', index=False, header=True)
+
+def run_scoring(strategy_names, argv = None):
+    # Function to run the scoring analysis for the given strategies with the command line arguments of the variant_scoring_*.py scripts:
+    # <metadata> <tp_sites.csv> <output dir> <weights> <known_variants_of_concern.csv> <sequences under review> [<MM> <YYYY>]
+    # [--max-memory <size>] [--incremental <store directory>] [--months <YYYY-MM:YYYY-MM>] [--jobs <number of processes>] [--exclusions <file>]
+    # [--output-format <tsv or parquet>] [--output-layout <wide or normalized>] [--cube <directory>]
+    argv = list(sys.argv if argv is None else argv)
+    start_time = datetime.datetime.now()
+
+    # Optional memory budget of the analysis batches (--max-memory <size>, ie. 4G or 512M)
+    max_memory = parse_memory_size(pop_option(argv, "--max-memory") or DEFAULT_MAX_MEMORY)
+    # Optional parallel mode (--jobs <number of worker processes>), the memory budget is shared by the workers
+    jobs = int(pop_option(argv, "--jobs") or 1)
+    # Optional incremental mode (--incremental <store directory>), the per-sequence weights of the previous run are reused
+    weights_store = pop_option(argv, "--incremental")
+    if weights_store is not None and len(strategy_names) > 1:
+        print("The incremental mode can only be used with a single scoring strategy")
+        sys.exit(1)
+    # Optional backfill mode (--months <YYYY-MM:YYYY-MM>), the metadata is read and scored once and the results
+    # of every month are written to their own MM-YYYY directory in the output directory
+    backfill_months = pop_option(argv, "--months")
+    if backfill_months is not None:
+        backfill_months = month_range(backfill_months)
+    # Optional format of the per-sequence scores (--output-format tsv or parquet, default tsv)
+    scores_format = output_format(pop_option(argv, "--output-format"))
+    # Optional layout of the per-sequence scores (--output-layout wide or normalized, default wide), the normalized layout
+    # writes every distinct profile, lineage and location once and only their codes per sequence
+    scores_layout = output_layout(pop_option(argv, "--output-layout"))
+    # Optional persistent exclusion set (--exclusions <file>), the sequences under review of every run are added to it
+    exclusion_path = pop_option(argv, "--exclusions")
+    # Optional daily aggregate cube (--cube <directory>), the entries of the scored months are added to the cube of every strategy
+    cube_dir = pop_option(argv, "--cube")
+
+    for argument in argv[:7]:
+        print(argument)
+    print(len(argv), "\n")
+    print("Scoring strategies: ", ", ".join(strategy_names))
+
+    print("Reading in the reference files: ")
+    tpSites = pd.read_csv(argv[2], sep = ',')
+    output = argv[3]
+    weight_paths = strategy_weight_paths(strategy_names, argv[4])
+    weight_tables = strategy_weight_tables(strategy_names, weight_paths)
+    voc_df = pd.read_csv(argv[5], sep = ',')
+    vocabulary_path = os.path.join(os.path.dirname(os.path.abspath(argv[4])), "mutation_vocabulary.tsv")
+    try:
+        seqsUI = pd.read_csv(argv[6], sep = '\t')
+    except pd.errors.EmptyDataError:
+        print("Sequences under review file was empty, skipping.")
+        seqsUI = pd.DataFrame(columns = ['Accession ID','Collection date','Submission date','Location'])
+    # Boolean array of the true positive antigenic sites, used by the strategies that only score the antigenic sites
+    tp_bitset = tp_site_bitset(tpSites['tp_sites'].values)
+
+    metadata_time = datetime.datetime.now()
+    print('import data Duration: {}'.format(metadata_time - start_time))
+
+    print("Calculating Mutation Scores....")
+    max_month, max_year = analysis_month(argv)
+    # Sorted array of the accession numbers of the sequences under review (accumulated over the runs with --exclusions)
+    if exclusion_path is None:
+        exclusion = exclusion_array(seqsUI["Accession ID"])
+    else:
+        exclusion = update_exclusion_set(exclusion_path, seqsUI["Accession ID"])
+    print("Filtering Metadata by most recent month")
+    # Streaming the metadata file and only keeping the rows of the analysis month(s) (human host, not under review)
+    if backfill_months is None:
+        monthly_metadata, max_month, max_year = read_analysis_metadata(argv[1], output, max_month, max_year, exclusion)
+        analysis_months = [max_year + '-' + max_month]
+        print("Writing Months Text File")
+        month_file = open(output + "month_vis.txt", "w")
+        month_file.writelines(str(max_month) + "-" + str(max_year))
+        month_file.close()
+    else:
+        analysis_months = backfill_months
+        monthly_metadata = read_monthly_metadata(argv[1], analysis_months, exclusion)
+        if len(monthly_metadata) == 0:
+            print("ERROR - there is no isolate data for the months: ", analysis_months[0], " to ", analysis_months[-1])
+            sys.exit()
+    print("Monthly Filtration Complete\n")
+    # The distinct locations are parsed once (and kept in the location cache of the reference directory)
+    monthly_metadata = add_location_regions(monthly_metadata, os.path.join(os.path.dirname(os.path.abspath(argv[4])), DEFAULT_LOCATION_CACHE))
+    month_filter_time = datetime.datetime.now()
+    print('monthly filtration Duration: {}'.format(month_filter_time - metadata_time))
+
+    # Incremental mode, only the new and changed sequences are scored and the other weights are taken from the store
+    metadata_to_score = monthly_metadata
+    if weights_store is not None:
+        print("Reading the weight store: ", weights_store)
+        fingerprint = weights_fingerprint(__file__, *[path for path in weight_paths.values() if path is not None]) + ":" + strategy_names[0]
+        store = load_weight_store(weights_store, fingerprint)
+        # The weight store is keyed by the accession id strings
+        stored_weights, rescore = split_by_store(readable_metadata(monthly_metadata[['Accession ID', 'AA Substitutions']]), store, analysis_months)
+        stored_weights.index = compact_accession_ids(stored_weights.index)
+        metadata_to_score = monthly_metadata[rescore]
+
+    print("\nRunning Analysis - Calculating Antigenic Scores for Pango Lineages")
+    tstart = process_time()
+    # Scoring every distinct AA Substitutions profile only once, the weights are broadcast back to the sequences afterwards
+    profile_codes, profiles_df = factorize_profiles(metadata_to_score['AA Substitutions'])
+    pool, shared_tables = scoring_pool(jobs, strategy_names, weight_tables, tp_bitset, max_memory)
+    # The worker processes and the shared weight tables are released even if the scoring fails, the workers are stopped without
+    # finishing their tasks on an error
+    try:
+        profile_weights = score_profiles(profiles_df, strategy_names, weight_tables, tp_bitset, vocabulary_path, max_memory, pool, jobs)
+        # The profile strings are not needed anymore once they are tokenized and scored, the sequences keep their
+        # AA Substitutions as a categorical (profile codes) for the output files
+        del profiles_df
+        sequence_weights = [broadcast_profile_weights(profile_weights[name], profile_codes, metadata_to_score['Accession ID'])['Weight'].rename(name) for name in strategy_names]
+        metadata_filtered_weights = pd.concat(sequence_weights, axis = 1)
+        if weights_store is not None:
+            metadata_filtered_weights = pd.concat([stored_weights.rename(columns = {'Weight': strategy_names[0]}), metadata_filtered_weights])
+        tstop = process_time()
+        print("\nProcess Time: ", tstop - tstart)
+
+        analysis_time = datetime.datetime.now()
+        print('analysis time Duration: {}'.format(analysis_time - month_filter_time))
+
+        # Summing Weights by accession ID
+        print("Merging Dataframes")
+        # The weights are added to the metadata as columns (aligned by accession id) instead of merging into a new per-sequence frame
+        metadata_filtered_weights = metadata_filtered_weights[~metadata_filtered_weights.index.duplicated()]
+        for name in strategy_names:
+            monthly_metadata[name] = metadata_filtered_weights[name].reindex(monthly_metadata['Accession ID']).fillna(0).values
+        df = monthly_metadata
+
+        if weights_store is not None:
+            print("Updating the weight store")
+            save_weight_store(weights_store, fingerprint, store, readable_metadata(df[['Accession ID', 'Collection date', 'AA Substitutions', strategy_names[0]]]).rename(columns = {strategy_names[0]: 'Weight'}), analysis_months)
+
+        if cube_dir is not None:
+            cubes = cube_aggregates(df, strategy_names, pool)
+            for name in strategy_names:
+                print("Updating the aggregate cube of: ", name)
+                cube_fingerprint = weights_fingerprint(__file__, *[path for path in [weight_paths[name]] if path is not None]) + ":" + name
+                write_cube(cubes[name], os.path.join(cube_dir, name), cube_fingerprint)
+
+        if backfill_months is None:
+            write_month_results(df, output, strategy_names, voc_df, max_memory, pool, scores_format, scores_layout)
+        else:
+            # Writing the results of every month of the backfill in a single pass over the scored sequences, the rows of every month are taken from the month index
+            index = month_index(df['Collection date'])
+            for month in backfill_months:
+                month_df = df.iloc[month_rows(index, month_code(month))]
+                if len(month_df) == 0:
+                    continue
+                month_output = os.path.join(output, month[5:] + "-" + month[:4]) + "/"
+                print("\nWriting results for: ", month, " (", len(month_df), " sequences) to ", month_output)
+                os.makedirs(month_output, exist_ok = True)
+                month_file = open(month_output + "month_vis.txt", "w")
+                month_file.writelines(month[5:] + "-" + month[:4])
+                month_file.close()
+                write_month_results(month_df.reset_index(drop = True), month_output, strategy_names, voc_df, max_memory, pool, scores_format, scores_layout)
+            missing_months = [month for month in backfill_months if month_code(month) not in index[1]]
+            if len(missing_months) > 0:
+                print("No isolate data for: ", ", ".join(missing_months))
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    else:
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.join()
+        release_arrays(shared_tables)
+
+    end_time = datetime.datetime.now()
+    print('df_final Duration: {}'.format(end_time - analysis_time))
+    print('Duration: {}'.format(end_time - start_time))
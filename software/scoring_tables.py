@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Lookup tables used by the variant_scoring_*.py scripts to select and weight the tokenized spike
+# substitutions with vectorized array indexing instead of string matching.
+
+import numpy as np
+import pandas as pd
+
+SPIKE_LENGTH = 1273
+# Amino acid codes of the weight tables, any other Original_aa/Changed_aa (ie. "del", "ins", "" for stop codons)
+# gets the last code whose weights are always 0
+AMINO_ACIDS = ['A', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'T', 'V', 'W', 'Y', 'X']
+
+def tp_site_bitset(tp_sites):
+    # Function to return a boolean array over the spike positions (index = position, 0 and 1..1273) that is True at the true positive sites
+    bitset = np.zeros(SPIKE_LENGTH + 1, dtype = bool)
+    tp_sites = np.asarray(tp_sites, dtype = 'int64')
+    bitset[tp_sites[(tp_sites > 0) & (tp_sites <= SPIKE_LENGTH)]] = True
+    return (bitset)
+
+def at_tp_sites(positions, bitset):
+    # Function to return a boolean mask of the positions that are true positive sites, positions outside of the spike are never selected
+    positions = np.asarray(positions, dtype = 'int64')
+    in_spike = (positions >= 0) & (positions < len(bitset))
+    mask = np.zeros(len(positions), dtype = bool)
+    mask[in_spike] = bitset[positions[in_spike]]
+    return (mask)
+
+def aa_codes(amino_acids):
+    # Function to return the integer code of every amino acid (position in AMINO_ACIDS, len(AMINO_ACIDS) for anything else)
+    codes = pd.Index(AMINO_ACIDS).get_indexer(pd.Series(amino_acids).astype(str))
+    codes[codes < 0] = len(AMINO_ACIDS)
+    return (codes)
+
+def aa_change_codes(weights):
+    # Function to return the original and changed amino acid codes of every row of a weights table
+    return (aa_codes(weights['Original_aa'].values), aa_codes(weights['Changed_aa'].values))
+
+def aa_weight_matrix(weights):
+    # Function to compile a weights table (Original_aa, Changed_aa, Weight) into a square array indexed by
+    # [original aa code, changed aa code], missing weights are 0 and repeated amino acid changes are summed
+    matrix = np.zeros((len(AMINO_ACIDS) + 1, len(AMINO_ACIDS) + 1), dtype = 'float64')
+    np.add.at(matrix, aa_change_codes(weights), weights['Weight'].fillna(0).values.astype('float64'))
+    matrix[-1, :] = 0
+    matrix[:, -1] = 0
+    return (matrix)
+
+def reversible_weight_matrix(weights):
+    # Function to compile a weights table into a weight array where every amino acid change that is not in the
+    # table gets the weight of the reversed change (ie. weight of Y->N for N->Y), changes in the table keep their weight
+    in_table = np.zeros((len(AMINO_ACIDS) + 1, len(AMINO_ACIDS) + 1), dtype = bool)
+    in_table[aa_change_codes(weights)] = True
+    matrix = aa_weight_matrix(weights)
+    return (np.where(in_table, matrix, matrix.T))
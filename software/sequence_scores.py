@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Writer and reader of the per-sequence antigenic scores (antigenic_scores_all) of the scoring scripts. The
+# scores are written either as the tab separated antigenic_scores_all.csv or, with --output-format parquet,
+# as antigenic_scores_all.parquet with typed columns (the repeated Location, Pango lineage and AA Substitutions
+# strings are dictionary encoded) and compression. The rows are written in batches, so the whole table is never
+# held in memory, and the downstream scripts only read the columns they need.
+#
+# With --output-layout normalized the repeated strings are not written per sequence at all: every distinct
+# substitution profile (with its weight), lineage (with its antigenic score) and location is written once to
+# its own table and the per-sequence table (antigenic_scores_all_sequences) only holds the accession id, the
+# collection date and the codes of the location, lineage and profile of the sequence. read_sequence_scores
+# rebuilds the requested columns of the wide table from the codes, only the tables of those columns are read.
+
+import os
+import numpy as np
+import pandas as pd
+
+SEQUENCE_SCORES = "antigenic_scores_all"
+OUTPUT_FORMATS = {'tsv': '.csv', 'parquet': '.parquet'}
+DEFAULT_OUTPUT_FORMAT = "tsv"
+OUTPUT_LAYOUTS = ["wide", "normalized"]
+DEFAULT_OUTPUT_LAYOUT = "wide"
+# Tables of the normalized layout and the columns of the wide table that they hold, with the code column that the
+# per-sequence table (sequences) uses to refer to their rows
+NORMALIZED_TABLES = {'sequences': (None, ["Accession ID", "Collection date"]),
+                     'locations': ("location_code", ["Location"]),
+                     'lineages': ("lineage_code", ["Pango lineage", "antigenic_score"]),
+                     'profiles': ("profile_id", ["AA Substitutions", "Weight"])}
+
+def output_format(value):
+    # Function to check the --output-format option, returns the output format (tsv or parquet)
+    value = (value or DEFAULT_OUTPUT_FORMAT).lower()
+    if value not in OUTPUT_FORMATS:
+        raise ValueError("Invalid output format: " + value + " (expected " + " or ".join(OUTPUT_FORMATS) + ")")
+    return (value)
+
+def sequence_scores_path(results_dir, output_format, name = SEQUENCE_SCORES):
+    # Function to return the path of the per-sequence scores file of the given format
+    return (os.path.join(results_dir, name + OUTPUT_FORMATS[output_format]))
+
+def output_layout(value):
+    # Function to check the --output-layout option, returns the output layout (wide or normalized)
+    value = (value or DEFAULT_OUTPUT_LAYOUT).lower()
+    if value not in OUTPUT_LAYOUTS:
+        raise ValueError("Invalid output layout: " + value + " (expected " + " or ".join(OUTPUT_LAYOUTS) + ")")
+    return (value)
+
+def normalized_table_path(results_dir, output_format, table, name = SEQUENCE_SCORES):
+    # Function to return the path of a table of the normalized layout (ie. antigenic_scores_all_profiles.parquet)
+    return (sequence_scores_path(results_dir, output_format, name + "_" + table))
+
+def remove_other_outputs(results_dir, paths, name = SEQUENCE_SCORES):
+    # Function to remove the per-sequence scores files of the other formats and layouts from an earlier run, so that
+    # the downstream scripts can not pick up outdated scores
+    for other_format in OUTPUT_FORMATS:
+        other_paths = [sequence_scores_path(results_dir, other_format, name)]
+        other_paths += [normalized_table_path(results_dir, other_format, table, name) for table in NORMALIZED_TABLES]
+        for other_path in other_paths:
+            if other_path not in paths and os.path.exists(other_path):
+                os.remove(other_path)
+
+def write_batches(batches, path, output_format):
+    # Function to write a table from an iterable of row batches (dataframes), every batch is appended to the file as soon as it is produced
+    if output_format == "parquet":
+        import pyarrow
+        import pyarrow.parquet
+        writer = None
+        try:
+            for batch in batches:
+                table = pyarrow.Table.from_pandas(batch, preserve_index = False)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(path, table.schema, compression = "zstd")
+                # The column types of all batches follow the first batch (ie. a column without values in a batch)
+                writer.write_table(table.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        return
+    with open(path, "w") as handle:
+        for batch_number, batch in enumerate(batches):
+            batch.to_csv(handle, sep = '\t', index = False, header = (batch_number == 0))
+
+def write_sequence_scores(batches, results_dir, output_format, name = SEQUENCE_SCORES):
+    # Function to write the per-sequence scores (wide layout) in the given format from an iterable of row batches (dataframes)
+    path = sequence_scores_path(results_dir, output_format, name)
+    remove_other_outputs(results_dir, [path], name)
+    write_batches(batches, path, output_format)
+
+def write_normalized_scores(batches, tables, results_dir, output_format, name = SEQUENCE_SCORES):
+    # Function to write the per-sequence scores in the normalized layout, the per-sequence table from an iterable of row
+    # batches and the locations, lineages and profiles tables (dataframes, keyed by the table name) at once
+    paths = {table: normalized_table_path(results_dir, output_format, table, name) for table in NORMALIZED_TABLES}
+    remove_other_outputs(results_dir, list(paths.values()), name)
+    for table, frame in tables.items():
+        write_batches([frame], paths[table], output_format)
+    write_batches(batches, paths['sequences'], output_format)
+
+def read_table(path, output_format, columns):
+    # Function to read the given columns of a per-sequence scores table, dictionary encoded columns are returned as strings like in the tsv file
+    if output_format == "tsv":
+        return (pd.read_csv(path, sep = '\t', usecols = columns))
+    table = pd.read_parquet(path, columns = columns)
+    categorical_columns = [column for column in table.columns if pd.api.types.is_categorical_dtype(table[column])]
+    table = table.astype({column: object for column in categorical_columns})
+    # Missing strings are NaN like in the tsv file (pyarrow returns None for the missing values of plain string columns)
+    object_columns = [column for column in table.columns if table[column].dtype == object]
+    return (table.assign(**{column: table[column].where(table[column].notna(), np.nan) for column in object_columns}))
+
+def read_normalized_scores(results_dir, output_format, columns, name = SEQUENCE_SCORES):
+    # Function to rebuild the given columns of the wide table from the normalized layout, the per-sequence table is read with
+    # the codes that the columns need and only the tables that hold the requested columns are read and looked up by code
+    tables = {table: [column for column in table_columns if column in columns] for table, (_, table_columns) in NORMALIZED_TABLES.items()}
+    tables = {table: table_columns for table, table_columns in tables.items() if len(table_columns) > 0 or table == 'sequences'}
+    code_columns = [NORMALIZED_TABLES[table][0] for table in tables if table != 'sequences']
+    sequences = read_table(normalized_table_path(results_dir, output_format, 'sequences', name), output_format, tables['sequences'] + code_columns)
+    scores = {column: sequences[column].values for column in tables['sequences']}
+    for table, table_columns in tables.items():
+        if table == 'sequences':
+            continue
+        code_column = NORMALIZED_TABLES[table][0]
+        values = read_table(normalized_table_path(results_dir, output_format, table, name), output_format, [code_column] + table_columns)
+        rows = pd.Index(values[code_column]).get_indexer(sequences[code_column])
+        scores.update({column: values[column].values.take(rows) for column in table_columns})
+    return (pd.DataFrame({column: scores[column] for column in columns}))
+
+def read_sequence_scores(results_dir, columns, name = SEQUENCE_SCORES):
+    # Function to read the given columns of the per-sequence scores of a results directory (the parquet file if there is
+    # one, otherwise the tsv file), the columns of a normalized layout are rebuilt from the profile, lineage and location tables
+    for scores_format in ("parquet", "tsv"):
+        if os.path.exists(sequence_scores_path(results_dir, scores_format, name)):
+            return (read_table(sequence_scores_path(results_dir, scores_format, name), scores_format, columns))
+        if os.path.exists(normalized_table_path(results_dir, scores_format, 'sequences', name)):
+            return (read_normalized_scores(results_dir, scores_format, columns, name))
+    raise FileNotFoundError("No per-sequence scores (" + name + ") found in " + results_dir)
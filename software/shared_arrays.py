@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shared memory helpers used by the parallel mode (--jobs) of scoring_engine.py. The arrays that every worker
+# process needs (the AA Substitutions profiles of the month, the compiled weight tables and the TP site mask)
+# are copied once into multiprocessing shared memory and the workers attach to them read only, instead of
+# every task pickling its data to the worker and every worker holding its own copy of the reference tables.
+
+import numpy as np
+from multiprocessing import shared_memory
+
+def share_array(array):
+    # Function to copy an array into a new shared memory block, returns the block (to be released with release_arrays)
+    # and the descriptor (name, shape, dtype) that the worker processes use to attach to it
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype = array.dtype, buffer = block.buf)[...] = array
+    return (block, (block.name, array.shape, array.dtype.str))
+
+def attach_array(descriptor):
+    # Function to attach to a shared array without copying it, returns the block (which has to be kept open
+    # as long as the array is used) and a read only view of the array
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name = name)
+    array = np.ndarray(shape, dtype = np.dtype(dtype), buffer = block.buf)
+    array.flags.writeable = False
+    return (block, array)
+
+def share_strings(strings):
+    # Function to copy a list of strings into shared memory as one utf-8 buffer (every string followed by a new line)
+    # and the offsets of the strings, returns the blocks and the descriptors of the buffer and the offsets
+    encoded = [string.encode() + b"\n" for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype = 'int64')
+    np.cumsum([len(string) for string in encoded], out = offsets[1:])
+    buffer_block, buffer_descriptor = share_array(np.frombuffer(b"".join(encoded), dtype = 'uint8'))
+    offsets_block, offsets_descriptor = share_array(offsets)
+    return ([buffer_block, offsets_block], (buffer_descriptor, offsets_descriptor))
+
+def with_shared_arrays(descriptors, function):
+    # Function to attach to the shared arrays, return function(*arrays) and detach again, the result must not be a view on the arrays
+    attached = [attach_array(descriptor) for descriptor in descriptors]
+    try:
+        return (function(*[array for _, array in attached]))
+    finally:
+        blocks = [block for block, _ in attached]
+        # The views have to be released before the blocks can be closed
+        del attached
+        for block in blocks:
+            block.close()
+
+def shared_strings(descriptors, start, stop):
+    # Function to return the strings start to stop (exclusive) of a shared string buffer, only that part of the buffer is decoded
+    if stop <= start:
+        return ([])
+    return (with_shared_arrays(descriptors, lambda buffer, offsets: bytes(buffer[offsets[start]:offsets[stop]]).decode().split("\n")[:-1]))
+
+def release_arrays(blocks):
+    # Function to close and free the shared memory blocks created by share_array / share_strings
+    for block in blocks:
+        block.close()
+        block.unlink()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shared helpers used by the variant_scoring_*.py scripts to score every distinct AA Substitutions
+# profile only once. Within a month most sequences share their AA Substitutions string with many other
+# sequences, so the (expensive) parsing and weighting is done per profile and the resulting Weight is
+# broadcast back to the sequences by the integer profile code.
+
+import numpy as np
+import pandas as pd
+
+def factorize_profiles(aa_substitutions):
+    # Function to return the profile code of every sequence and a dataframe of the distinct profiles
+    # (profile_id, AA Substitutions), sequences without AA Substitutions get the code -1
+    profile_codes, profiles = pd.factorize(aa_substitutions)
+    profiles_df = pd.DataFrame({'profile_id': np.arange(len(profiles)), 'AA Substitutions': np.asarray(profiles, dtype = object)})
+    print("Number of sequences: ", len(aa_substitutions))
+    print("Number of distinct AA Substitutions profiles: ", len(profiles_df))
+    return (profile_codes, profiles_df)
+
+def broadcast_profile_weights(profile_weights, profile_codes, accession_ids):
+    # Function to return the Weight of every sequence (indexed by Accession ID) from the weight of its profile,
+    # sequences without AA Substitutions get a NaN weight (the weights are copied as they are, any difference to
+    # the per-sequence weights of the original scripts comes from the profile scoring, see score_matrix)
+    weights_by_code = np.append(np.asarray(profile_weights, dtype = 'float64'), np.nan)
+    sequence_weights = pd.DataFrame({'Weight': weights_by_code[profile_codes]}, index = pd.Index(accession_ids, name = 'Accession ID'))
+    return (sequence_weights[~sequence_weights.index.duplicated()])
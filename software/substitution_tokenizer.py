@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Batch tokenizer for the GISAID AA Substitutions column, shared by the variant_scoring_*.py scripts.
+# A whole column of substitution strings, ie. "(Spike_N501Y,NSP3_A1892T,Spike_H69del,Spike_ins214EPE)",
+# is parsed with a single regular expression pass over the joined column instead of splitting and
+# searching every substitution separately. The result has one row per substitution with the index of
+# the sequence (row) it came from, the protein, the position, the original and the changed amino acid.
+
+import re
+import numpy as np
+import pandas as pd
+
+TOKEN_COLUMNS = ['row', 'Protein', 'Substitution_Positions', 'Original_aa', 'Changed_aa']
+
+def token_pattern(protein):
+    # Function to compile the pattern of a substitution: protein, original aa (leading letters), position
+    # (first digits) and changed aa (letters after the last digit, ie. "del" for deletions and "" for stop codons)
+    protein_pattern = '(' + re.escape(protein) + ')' if protein is not None else r'([A-Za-z0-9]+)'
+    return (re.compile(protein_pattern + r'_([A-Za-z]*)[^\d,)]*(\d*)(?:[^,)]*\d)?([A-Za-z]*)'))
+
+def tokenize_substitutions(aa_substitutions, protein = "Spike"):
+    # Function to return a dataframe of all substitutions of the given protein (all proteins if None),
+    # the row column is the position of the sequence in aa_substitutions, missing values have no substitutions
+    substitutions = pd.Series(aa_substitutions).fillna('').astype(str).to_list()
+    matches = token_pattern(protein).findall(",".join(substitutions))
+    tokens = pd.DataFrame(matches, columns = ['Protein', 'Original_aa', 'Substitution_Positions', 'Changed_aa'])
+    # Every substitution is matched exactly once, so the rows follow from the number of substitutions per sequence
+    needle = protein + '_' if protein is not None else '_'
+    tokens['row'] = np.repeat(np.arange(len(substitutions)), [x.count(needle) for x in substitutions])
+    tokens = tokens[tokens['Substitution_Positions'] != '']
+    # Converting the (few) distinct position strings instead of every token
+    position_codes, positions = pd.factorize(tokens['Substitution_Positions'])
+    tokens['Substitution_Positions'] = positions.astype('int64').values[position_codes] if len(positions) > 0 else np.zeros(0, dtype = 'int64')
+    return (tokens[TOKEN_COLUMNS].reset_index(drop = True))
@@ -3,6 +3,7 @@
 import sys
 import pandas as pd
 import plotly.express as px
+from location_parser import REPOSITORY_LOCATION_CACHE, location_columns
 
 df = pd.read_csv(sys.argv[1], sep = "\t")
 output = sys.argv[2]
@@ -55,21 +56,9 @@ def df_selection (df, month, year):
     return df_vis_threshold_averaged
 
 # Creating country and continent column for later analysis
+# (the stripped continent and country are parsed once per distinct location, kept in the location cache of the repository)
 df_vis = df[['Location', 'Pango lineage', 'antigenic_score', 'Collection date']]
-df_vis["Continent"] = df_vis["Location"].apply(lambda x: x.split("/")[0])
-df_vis["Country"] = df_vis["Location"].apply(lambda x: x.split("/")[1])
-country = []
-continent = []
-for item in df_vis["Country"]:
-    x = item.lstrip()
-    y = x.rstrip()
-    country.append(y)
-for item in df_vis["Continent"]:
-    x = item.lstrip()
-    y = x.rstrip()
-    continent.append(y)
-df_vis['Country'] = country
-df_vis['Continent'] = continent
+df_vis = pd.concat([df_vis, location_columns(df_vis["Location"], ["Continent", "Country"], REPOSITORY_LOCATION_CACHE)], axis = 1)
 df_vis.drop(["Location"], axis = 1, inplace = True)
 
 # Adding a year and month column to filter data by most current month
@@ -1,108 +1,34 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import sys
 import pandas as pd
 import numpy as np
-import re
 from matplotlib import pyplot as plt
+from substitution_tokenizer import tokenize_substitutions
+from scoring_tables import aa_weight_matrix, aa_change_codes
 
 columns = ['Location', 'Collection date', 'Accession ID', 'Pango lineage', 'AA Substitutions']
 
-metadata = pd.read_csv(sys.argv[0], sep = '\t', usecols = columns)
-tpSites = pd.read_csv(sys.arg[1], sep = ',')
+metadata = pd.read_csv(sys.argv[1], sep = '\t', usecols = columns)
+tpSites = pd.read_csv(sys.argv[2], sep = ',')
 tpSites_list = tpSites['tp_sites'].tolist()
-tpSites_list = map(str, tpSites_list) 
-output = sys.arg[2]
-weights = pd.read_csv(sys.arg[3], sep = '\t')
-
-def comparing_lists(list1):
-# Function to find the intersection of two lists and returns the length of the intersection
-    common = list(set(list1).intersection(set(top_pos_list)))
-    return(len(common))
-
-def conversion_position(x):
-# Function to convert aa list in the metadata file to their position and original / changed aa
-    subsList = x.split(',')
-    mutationsSubsList = []
-    spike_mutations = []
-    for i in subsList:
-        if "Spike" in i:
-            spike_mutations.append(i)
-    for i in spike_mutations:
-        if i.__contains__("_"):
-            pos = i[i.index("_"):]
-            x = pos[1:]
-            pos = "".join([i for i in pos if i.isdigit()])
-            mutationsSubsList.append(pos)
-        else:
-            mutationsSubsList.append(None)
-    return(mutationsSubsList)
-
-def conversion_originalAA(x):
-# Function to convert aa list in the metadata file to a list of the original aa 
-    subsList = x.split(',')
-    original_aaList = []
-    spike_mutations = []
-    for i in subsList:
-        if "Spike" in i:
-            spike_mutations.append(i)
-    for i in spike_mutations:
-        if i.__contains__("_"):
-            pos = i[i.index("_"):]
-            x = pos[1:]
-            ogAAList = re.findall('([a-zA-Z]*)\d*.*', x)
-            original_aaList.append(ogAAList[0])
-    return(original_aaList)
-
-def conversion_changedAA(x):
-# Function to convert aa list in the metadata file to a list of the original aa 
-    subsList = x.split(',')
-    changed_aaList = []
-    spike_mutations = []
-    for i in subsList:
-        if "Spike" in i:
-            spike_mutations.append(i)
-    for i in spike_mutations:
-        if i.__contains__("_"):
-            pos = i[i.index("_"):]
-            x = pos[1:]
-            cAAList = re.findall('\d([a-zA-Z]*)', x)
-            cAA = cAAList[-1:]
-            q = ''.join([str(i) for i in cAA])
-            changed_aaList.append(q)
-    return(changed_aaList)
+tpSites_list = list(map(str, tpSites_list))
+output = sys.argv[3]
+weights = pd.read_csv(sys.argv[4], sep = '\t')
+weight_table = aa_weight_matrix(weights)
 
 def position_scores(input_df): # , output_df
 # Function to add mutation scores to the metadata file based on amino acid changes
-    input_df['AA Substitutions'] = input_df['AA Substitutions'].astype('string') 
-    # Getting a list of all substitutions and amino acid changes per sequence
-    substitutions = []
-    original_AAs = []
-    changed_AAs = []
-    for i in input_df['AA Substitutions']:
-        if len(i) == 0 or i == np.NaN:
-            x = np.NaN
-            substitutions.append(x)
-            original_AAs.append(x)
-            changed_AAs.append(x)
-        else:
-            substitution_pos = conversion_position(i)
-            substitutions.append(substitution_pos)
-            ogAA = conversion_originalAA(i)
-            original_AAs.append(ogAA)
-            cAA = conversion_changedAA(i)
-            changed_AAs.append(cAA)
-    if len(substitutions) == len(original_AAs) & len(original_AAs) == len(changed_AAs):
-        input_df["Substitution_Positions"] = substitutions
-        input_df["Original_aa"] = original_AAs
-        input_df["Changed_aa"] = changed_AAs
-    else:
-        print("Length of spike substitution positions does not match the length of amino acid changes at those positions!")
-        sys.exit()
+    # Getting all spike substitutions and amino acid changes per sequence (one row per substitution)
+    input_df = input_df.reset_index(drop = True)
+    tokens = tokenize_substitutions(input_df['AA Substitutions'])
+    metadata_expanded = input_df.iloc[tokens['row'].values].reset_index(drop = True)
+    metadata_expanded['Substitution_Positions'] = tokens['Substitution_Positions'].astype(str).values
+    metadata_expanded['Original_aa'] = tokens['Original_aa'].values
+    metadata_expanded['Changed_aa'] = tokens['Changed_aa'].values
     # Calculating the weight of spike amino acid changes
-    cols = ['Substitution_Positions','Original_aa','Changed_aa']
-    metadata_expanded = input_df.explode(cols)
-    metadata_weights_expanded = pd.merge(metadata_expanded, weights, how = 'left', on = ['Original_aa', 'Changed_aa'])
+    metadata_weights_expanded = metadata_expanded.assign(Weight = weight_table[aa_change_codes(metadata_expanded)])
     metadata_weights_expanded.drop('AA Substitutions', axis = 1, inplace = True)
     metadata_weights_expanded.drop_duplicates(inplace = True)
     # Summing the weight across each position per lineage
@@ -219,14 +145,18 @@ plt.close(fig = None)
 metadata.drop(['Accession ID', 'Collection date', 'Location'], axis = 1, inplace = True)
 metadata = metadata.dropna(subset=['AA Substitutions'])
 metadata.drop_duplicates(inplace = True)
-metadata['Substitution_Positions'] = metadata['AA Substitutions'].apply(conversion_position)
+metadata.reset_index(drop = True, inplace = True)
 print(pd.DataFrame.head(metadata))
 
+# Counting the distinct top 50 positions that are substituted in every sequence
 top_pos_list = list(topDF['Substitution_Positions'])
-metadata['number_of_top_sites'] = metadata["Substitution_Positions"].apply(comparing_lists)
+metadata_tokens = tokenize_substitutions(metadata['AA Substitutions'])
+metadata_tokens = metadata_tokens[metadata_tokens['Substitution_Positions'].astype(str).isin(top_pos_list)]
+metadata_tokens = metadata_tokens.drop_duplicates(subset = ['row', 'Substitution_Positions'])
+metadata['number_of_top_sites'] = metadata_tokens.groupby('row').size().reindex(metadata.index, fill_value = 0)
 top_lineages = metadata[metadata['number_of_top_sites'] > 0]
 top_lineages['averaged_number_of_top_sites'] = top_lineages.groupby('Pango lineage')['number_of_top_sites'].transform('mean')
-top_lineages.drop(['Substitution_Positions', 'number_of_top_sites'], axis = 1, inplace = True)
+top_lineages.drop(['number_of_top_sites'], axis = 1, inplace = True)
 top_lineages.drop_duplicates(inplace = True)
 top_lineages['number_of_sites_rank'] = top_lineages['averaged_number_of_top_sites'].rank(ascending = False)
 top_lineages = top_lineages.sort_values('number_of_sites_rank', ascending = True)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# The purpose of this script is to compare the scoring methods, every scoring strategy of scoring_engine.py (the
+# analyses of the variant_scoring_*.py scripts) is calculated from a single read and tokenization of the metadata.
+# Takes the same arguments as variant_scoring_all_sites.py, the other weight tables are taken from the directory
+# of the given antigenic_weights.csv. The results of every strategy are written to <output>/<strategy>/ and the
+# weights and ranks of all strategies side by side to antigenic_scores_all_strategies.csv and
+# antigenic_scores_ranked_all_strategies.csv. Use --strategies <name,name> to only run some of the strategies.
+
+import sys
+from scoring_engine import STRATEGIES, pop_option, run_scoring
+
+if __name__ == '__main__':
+    argv = list(sys.argv)
+    strategy_names = pop_option(argv, "--strategies")
+    strategy_names = list(STRATEGIES) if strategy_names is None else strategy_names.split(",")
+    unknown_strategies = [name for name in strategy_names if name not in STRATEGIES]
+    if len(unknown_strategies) > 0:
+        print("Unknown scoring strategies: ", ", ".join(unknown_strategies), ", available: ", ", ".join(STRATEGIES))
+        sys.exit(1)
+
+    run_scoring(strategy_names, argv)
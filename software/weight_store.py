@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Per-sequence weight store used by the incremental mode of the variant_scoring_*.py scripts.
+# The store keeps the Weight of every scored sequence together with a hash of its AA Substitutions,
+# so that the next run on a newer GISAID snapshot only has to re-score the sequences that are new or
+# whose substitutions changed. The lineage and country scores are then recalculated from the stored
+# per-sequence weights. The store is only reused if the weights table (and scoring script) did not change.
+#
+# <store dir>/sequence_weights.tsv : Accession ID, profile_hash, collection_month, Weight
+# <store dir>/weights_fingerprint.txt : md5 of the files that define the weights
+
+import os
+import hashlib
+import pandas as pd
+
+STORE_FILE = "sequence_weights.tsv"
+FINGERPRINT_FILE = "weights_fingerprint.txt"
+STORE_COLUMNS = ['Accession ID', 'profile_hash', 'collection_month', 'Weight']
+
+def weights_fingerprint(*paths):
+    # Function to return the md5 of the given files, used to invalidate the store when the weights change
+    md5 = hashlib.md5()
+    for path in paths:
+        md5.update(os.path.basename(path).encode())
+        with open(path, "rb") as handle:
+            md5.update(handle.read())
+    return (md5.hexdigest())
+
+def profile_hashes(aa_substitutions):
+    # Function to return a 64 bit hash of every AA Substitutions string (missing values are hashed as well)
+    return (pd.util.hash_pandas_object(aa_substitutions.astype(str), index = False).values.view('int64'))
+
+def load_weight_store(store_dir, fingerprint):
+    # Function to read the stored per-sequence weights, an empty store is returned if there is no
+    # store yet or if it was created with different weights
+    empty_store = pd.DataFrame(columns = STORE_COLUMNS).set_index('Accession ID')
+    store_path = os.path.join(store_dir, STORE_FILE)
+    fingerprint_path = os.path.join(store_dir, FINGERPRINT_FILE)
+    if not os.path.isfile(store_path) or not os.path.isfile(fingerprint_path):
+        print("No weight store found in ", store_dir, ", scoring all sequences")
+        return (empty_store)
+    with open(fingerprint_path) as handle:
+        stored_fingerprint = handle.read().strip()
+    if stored_fingerprint != fingerprint:
+        print("Weight store was created with different weights, scoring all sequences")
+        return (empty_store)
+    store = pd.read_csv(store_path, sep = '\t', dtype = {'Accession ID': 'str', 'profile_hash': 'int64', 'collection_month': 'str', 'Weight': 'float64'}, float_precision = 'round_trip')
+    print("Sequences in the weight store: ", len(store))
+    return (store.set_index('Accession ID'))
+
+def split_by_store(metadata, store, months):
+    # Function to compare the metadata of this run with the store, returns the stored weights that can be
+    # reused and a boolean mask of the metadata rows that have to be (re-)scored
+    hashes = profile_hashes(metadata['AA Substitutions'])
+    positions = store.index.get_indexer(metadata['Accession ID'])
+    in_store = positions >= 0
+    reuse = in_store.copy()
+    reuse[in_store] = store['profile_hash'].values.astype('int64')[positions[in_store]] == hashes[in_store]
+    month_entries = store.index[store['collection_month'].isin(months)]
+    removed = ~month_entries.isin(metadata['Accession ID'])
+    print("New sequences: ", (~in_store).sum())
+    print("Changed sequences: ", (in_store & ~reuse).sum())
+    print("Removed sequences: ", removed.sum())
+    print("Reused sequence weights: ", reuse.sum())
+    reused_weights = store.loc[pd.unique(metadata['Accession ID'].values[reuse]), ['Weight']]
+    return (reused_weights, ~reuse)
+
+def save_weight_store(store_dir, fingerprint, store, metadata, months):
+    # Function to update the store with the weights of this run, entries of the analysed month(s) that
+    # are no longer in the metadata are removed, entries of other months are kept
+    sequences = metadata.drop_duplicates(subset = 'Accession ID')
+    sequence_weights = pd.DataFrame({'profile_hash': profile_hashes(sequences['AA Substitutions']),
+                                     'collection_month': sequences['Collection date'].str[:7].values,
+                                     'Weight': sequences['Weight'].values}, index = pd.Index(sequences['Accession ID'], name = 'Accession ID'))
+    other_months = store[~store['collection_month'].isin(months) & ~store.index.isin(sequence_weights.index)]
+    updated_store = pd.concat([other_months, sequence_weights])
+    os.makedirs(store_dir, exist_ok = True)
+    updated_store.reset_index()[STORE_COLUMNS].to_csv(os.path.join(store_dir, STORE_FILE), sep = '\t', index = False, header = True)
+    with open(os.path.join(store_dir, FINGERPRINT_FILE), "w") as handle:
+        handle.write(fingerprint)
+    print("Sequences saved in the weight store: ", len(updated_store))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# ## Sliding Window Scoring
+#
+# Script to calculate the lineage and country antigenic scores of the last 7, 14 and 28 days (or any other windows) from the
+# daily aggregate cube of a scoring strategy (written by the variant_scoring_*.py scripts with --cube <directory>). Only the
+# cube months that the windows cover are read. The daily sequence counts and weight sums are kept as running (prefix) sums per
+# lineage and per country and lineage, so the sums of any window are the difference of two rows and every window of every
+# day is calculated without summing its days again. The collection dates of only the month (YYYY-MM) are not in any window.
+#
+# <output dir>/window_<N>d/antigenic_scores_ranked_with_WHO.csv : ranked lineages of the N days up to the end date (same columns as the monthly file)
+# <output dir>/window_<N>d/antigenic_scores_map_visualization.csv : country scores of the N days up to the end date (same columns as the monthly file)
+# <output dir>/window_<N>d/window.txt : first and last day of the window
+# <output dir>/antigenic_scores_rolling.csv : lineage scores of the windows ending on each of the last <history> days
+# <output dir>/antigenic_scores_rolling_countries.csv : country scores of the windows ending on each of the last <history> days
+#
+# To Run:
+# python window_scoring.py <path to the cube directory of a strategy (ie. cube/weights_at_all_sites)> <path to known_variants_of_concern.csv> <path to output directory>
+#   [<end date YYYY-MM-DD, default the latest collection date of the cube>] [--windows <days, default 7,14,28>] [--history <days, default 28>]
+#   [--locations <path to location cache, ie. reference/location_codes.tsv>]
+
+import os
+import sys
+import datetime
+import numpy as np
+import pandas as pd
+from aggregate_cube import cube_months, read_cube, cube_days, prefix_sums
+from location_parser import location_columns
+from scoring_engine import STRATEGIES, pop_option, rank_lineages
+
+start_time = datetime.datetime.now()
+
+argv = list(sys.argv)
+windows = sorted(set(int(days) for days in (pop_option(argv, "--windows") or "7,14,28").split(",")))
+history = int(pop_option(argv, "--history") or 28)
+location_cache = pop_option(argv, "--locations")
+strategy_dir = argv[1]
+voc_df = pd.read_csv(argv[2], sep = ',')
+output = argv[3]
+strategy = os.path.basename(os.path.normpath(strategy_dir))
+# The ranked table has the lineage frequency, zscore and significance like the monthly table of the strategy
+significance = STRATEGIES.get(strategy, {}).get('significance', False)
+
+print("cube directory: ", strategy_dir)
+print("output directory: ", output)
+print("windows (days): ", ", ".join(str(days) for days in windows))
+print("history (days): ", history)
+if min(windows) < 1 or history < 1:
+    print("ERROR - the windows and the history need at least 1 day!")
+    sys.exit(1)
+
+months = cube_months(strategy_dir)
+if len(months) == 0:
+    print("ERROR - the cube directory has no months, please run the scoring with --cube first!")
+    sys.exit(1)
+if len(argv) > 4:
+    end_date = pd.Timestamp(argv[4])
+else:
+    # Latest full collection date of the latest month of the cube
+    latest_days = cube_days(read_cube(strategy_dir, months[-1:])["Collection date"])
+    end_date = pd.Timestamp(latest_days.max(), unit = "D")
+end_day = int(np.datetime64(end_date.date(), "D").astype("int64"))
+
+# Days of the running sums: the windows of the first history day start max(windows) - 1 days earlier
+n_days = history + max(windows) - 1
+first_day = end_day - n_days + 1
+first_date = pd.Timestamp(first_day, unit = "D")
+print("end date: ", end_date.date())
+print("first day of the windows: ", first_date.date())
+
+# Reading only the cube months that the windows cover
+window_months = [str(month) for month in pd.period_range(first_date, end_date, freq = "M")]
+cube = read_cube(strategy_dir, window_months)
+days = cube_days(cube["Collection date"])
+print("Cube entries read: ", len(cube), " (months: ", ", ".join(window_months), ")")
+print("Sequences without a full collection date (not in any window): ", cube["sequences"].values[days < 0].sum())
+
+# Codes of the lineages and of the (continent, country, lineage) combinations of the map visualization (without the lineage None)
+lineage_codes, lineages = pd.factorize(cube["Pango lineage"], sort = True)
+countries = location_columns(cube["Location"], ["Continent", "Country"], location_cache)
+keep = ((cube["Pango lineage"] != "None") & countries["Country"].notna()).values
+country_keys = pd.MultiIndex.from_arrays([countries["Continent"].fillna(""), countries["Country"], lineage_codes])
+pair_codes, pairs = pd.factorize(country_keys)
+pair_codes = np.where(keep, pair_codes, -1)
+pair_lineages = pairs.get_level_values(2).values
+country_codes, country_list = pd.factorize(pd.MultiIndex.from_arrays([pairs.get_level_values(0), pairs.get_level_values(1)]), sort = True)
+
+# Running sums per day of the sequence counts and weight sums per lineage and of the sequence counts per country and lineage
+sequences = cube["sequences"].values.astype("float64")
+lineage_counts = prefix_sums(days, lineage_codes, sequences, first_day, n_days, len(lineages))
+lineage_weights = prefix_sums(days, lineage_codes, cube["weight_sum"].values, first_day, n_days, len(lineages))
+pair_counts = prefix_sums(days, pair_codes, sequences, first_day, n_days, len(pairs))
+
+def window_scores(stops, window):
+    # Function to return the lineage counts, lineage antigenic scores and country scores (one row per window stop, the running sums
+    # row after the last day of the window) of the windows of the given number of days
+    counts = lineage_counts[stops] - lineage_counts[stops - window]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        scores = (lineage_weights[stops] - lineage_weights[stops - window]) / counts
+    # Country score: sum of the lineage antigenic scores (of all countries) weighted by the lineage frequency in the country
+    country_lineage_counts = pair_counts[stops] - pair_counts[stops - window]
+    country_counts = np.zeros((len(stops), len(country_list)))
+    np.add.at(country_counts, (slice(None), country_codes), country_lineage_counts)
+    country_scores = np.zeros((len(stops), len(country_list)))
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        np.add.at(country_scores, (slice(None), country_codes), np.nan_to_num(scores[:, pair_lineages]) * country_lineage_counts / country_counts[:, country_codes])
+    return (counts, scores, country_counts, country_scores)
+
+rolling_lineages = []
+rolling_countries = []
+# Running sums rows after each of the last history days (the last row is the end date)
+stops = np.arange(n_days - history + 1, n_days + 1)
+stop_dates = pd.to_datetime(first_day + stops - 1, unit = "D").strftime("%Y-%m-%d").values
+for window in windows:
+    print("Calculating the scores of the ", window, " day windows...")
+    counts, scores, country_counts, country_scores = window_scores(stops, window)
+
+    # Results of the window that ends on the end date, with the columns of the monthly results
+    window_output = os.path.join(output, "window_" + str(window) + "d") + "/"
+    os.makedirs(window_output, exist_ok = True)
+    with open(window_output + "window.txt", "w") as handle:
+        handle.write(pd.Timestamp(end_day - window + 1, unit = "D").strftime("%Y-%m-%d") + ":" + end_date.strftime("%Y-%m-%d") + "\n")
+    present = counts[-1] > 0
+    if not present.any():
+        print("No sequences in the ", window, " days up to ", end_date.date(), ", skipping the window results.")
+    else:
+        lineage_df = pd.DataFrame({'Pango lineage': np.asarray(lineages, dtype = object)[present], 'antigenic_score': scores[-1][present],
+                                   'count': counts[-1][present].astype('int64')})
+        df_merged_ranked = rank_lineages(lineage_df, lineage_df['count'].sum(), voc_df, significance)
+        df_merged_ranked.to_csv(window_output + "antigenic_scores_ranked_with_WHO.csv", sep='\t', index=False, header=True)
+        country_present = country_counts[-1] > 0
+        map_df = pd.DataFrame({'Continent': country_list.get_level_values(0)[country_present], 'Country': country_list.get_level_values(1)[country_present],
+                               'country_score': country_scores[-1][country_present]})
+        map_df['Continent'] = map_df['Continent'].replace("", np.nan)
+        map_df.to_csv(window_output + "antigenic_scores_map_visualization.csv", sep='\t', index=False, header=True)
+        print("Window results saved: ", window_output)
+
+    # Scores of the windows that end on each of the last history days (days and lineages or countries with sequences)
+    day_index, lineage_index = np.nonzero(counts > 0)
+    rolling_lineages.append(pd.DataFrame({'Date': stop_dates[day_index], 'window': window, 'Pango lineage': np.asarray(lineages, dtype = object)[lineage_index],
+                                          'antigenic_score': scores[day_index, lineage_index], 'sequences': counts[day_index, lineage_index].astype('int64')}))
+    day_index, country_index = np.nonzero(country_counts > 0)
+    rolling_countries.append(pd.DataFrame({'Date': stop_dates[day_index], 'window': window, 'Continent': country_list.get_level_values(0)[country_index],
+                                           'Country': country_list.get_level_values(1)[country_index], 'country_score': country_scores[day_index, country_index],
+                                           'sequences': country_counts[day_index, country_index].astype('int64')}))
+
+rolling_lineages = pd.concat(rolling_lineages, ignore_index = True).sort_values(['Date', 'window', 'Pango lineage'], ignore_index = True)
+rolling_lineages.to_csv(os.path.join(output, "antigenic_scores_rolling.csv"), sep='\t', index=False, header=True)
+rolling_countries = pd.concat(rolling_countries, ignore_index = True).sort_values(['Date', 'window', 'Continent', 'Country'], ignore_index = True)
+rolling_countries['Continent'] = rolling_countries['Continent'].replace("", np.nan)
+rolling_countries.to_csv(os.path.join(output, "antigenic_scores_rolling_countries.csv"), sep='\t', index=False, header=True)
+print("Rolling scores saved: ", len(rolling_lineages), " lineage rows, ", len(rolling_countries), " country rows")
+
+print('Duration: {}'.format(datetime.datetime.now() - start_time))
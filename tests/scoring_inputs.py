@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Synthetic inputs of the scoring engine checks (a small metadata file with the cases the month filter has to handle) and
+# a helper that runs the scoring of a month on them like the variant_scoring_*.py scripts, shared by the tests/test_*.py files.
+
+import os
+import sys
+import shutil
+import pandas as pd
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPOSITORY, "software"))
+from scoring_engine import run_scoring
+
+METADATA_COLUMNS = ["Accession ID", "Collection date", "Location", "Host", "Pango lineage", "AA Substitutions"]
+# Synthetic metadata: an environment sample, a sequence of the month before, a date of only the month, the lineage None and a
+# sequence without substitutions
+METADATA_ROWS = [
+    ("EPI_ISL_1", "2024-09-01", "Europe / Germany / Berlin", "Human", "JN.1", "(Spike_A475D,Spike_N501Y,NSP3_A10V)"),
+    ("EPI_ISL_2", "2024-09-03", "Europe / Germany / Bavaria", "Human", "JN.1", "(Spike_E484K,Spike_H69del)"),
+    ("EPI_ISL_3", "2024-09-03", "Europe / France / Paris", "Human", "KP.2", "(Spike_N501Y,Spike_ins214EPE,Spike_G486*)"),
+    ("EPI_ISL_4", "2024-09-10", "Europe / France / Paris", "Human", "KP.2", "(Spike_L452R,Spike_T478K,Spike_D614G)"),
+    ("EPI_ISL_5", "2024-09", "Asia / China", "Human", "BA.2", "()"),
+    ("EPI_ISL_6", "2024-09-12", "Asia / China", "Human", "None", "(Spike_D614G,Spike_K417N)"),
+    ("EPI_ISL_7", "2024-09-20", "North America / USA / Texas", "Human", "BA.2", "(Spike_K417N,Spike_S477N,Spike_Q493R)"),
+    ("EPI_ISL_8", "2024-09-21", "North America / USA / Texas", "Environment", "BA.2", "(Spike_K417N)"),
+    ("EPI_ISL_9", "2024-08-30", "Europe / Germany / Berlin", "Human", "JN.1", "(Spike_K417N)"),
+    ("EPI_ISL_10", "2024-09-25", "Europe / Germany / Berlin", "Human", "KP.2", "(Spike_E484K)"),
+]
+UNDER_REVIEW = ["EPI_ISL_10"]
+RESULT_FILES = ["antigenic_scores_all.csv", "antigenic_scores_ranked_with_WHO.csv", "antigenic_scores_map_visualization.csv"]
+
+def write_inputs(tmp_path, rows = METADATA_ROWS):
+    # Writes the metadata file (of the given rows), the sequences under review and a copy of the weight tables (the vocabulary and
+    # location cache are written next to the weights) to the temporary directory
+    reference = tmp_path / "reference"
+    if not reference.exists():
+        reference.mkdir()
+        for weights_file in ["antigenic_weights.csv", "antigenic_weights_higher_threshold.csv"]:
+            shutil.copy(os.path.join(REPOSITORY, "reference", weights_file), reference)
+    pd.DataFrame(rows, columns = METADATA_COLUMNS).to_csv(tmp_path / "metadata.tsv", sep = '\t', index = False)
+    pd.DataFrame({"Accession ID": UNDER_REVIEW, "Collection date": "2024-09-25", "Submission date": "2024-10-01", "Location": "x"}).to_csv(tmp_path / "under_review.tsv", sep = '\t', index = False)
+
+def run_month(tmp_path, name, extra_arguments = (), month = "09", year = "2024", strategy_names = ("weights_at_all_sites",)):
+    # Runs the scoring of the month (the synthetic inputs are written on the first run) with the tsv output, returns the output directory
+    if not (tmp_path / "metadata.tsv").exists():
+        write_inputs(tmp_path)
+    output = tmp_path / name
+    output.mkdir()
+    argv = ["variant_scoring_all_sites.py", str(tmp_path / "metadata.tsv"), os.path.join(REPOSITORY, "reference", "tp_sites.csv"), str(output) + "/",
+            str(tmp_path / "reference" / "antigenic_weights.csv"), os.path.join(REPOSITORY, "reference", "known_variants_of_concern.csv"),
+            str(tmp_path / "under_review.tsv"), month, year, "--output-format", "tsv"] + list(extra_arguments)
+    run_scoring(list(strategy_names), argv)
+    return (output)
+
+def assert_same_results(output, expected, file_names = RESULT_FILES):
+    # Checks that the result files of two runs have the same rows (in the same order) and values
+    for file_name in file_names:
+        pd.testing.assert_frame_equal(pd.read_csv(os.path.join(output, file_name), sep = '\t'), pd.read_csv(os.path.join(expected, file_name), sep = '\t'))
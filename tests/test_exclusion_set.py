@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Checks of the exclusion set of the sequences under review (sorted array of the accession numbers) against the
+# accession ids it was built from, and of the stored set that accumulates the ids of every run.
+#
+# To Run:
+# python -m pytest tests/
+
+import os
+import sys
+import numpy as np
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPOSITORY, "software"))
+from exclusion_set import exclusion_array, is_excluded, update_exclusion_set
+
+def test_exclusion_array_lookup():
+    exclusion = exclusion_array(["EPI_ISL_30", "EPI_ISL_4", "EPI_ISL_30", "not_an_id"])
+    assert exclusion.tolist() == [4, 30]
+    assert is_excluded(["EPI_ISL_4", "EPI_ISL_5", "EPI_ISL_30", "EPI_ISL_31", "not_an_id"], exclusion).tolist() == [True, False, True, False, False]
+    assert not is_excluded(["EPI_ISL_4"], exclusion_array([])).any()
+
+def test_stored_exclusion_set(tmp_path):
+    # The stored set accumulates the ids of every run (sorted and distinct)
+    path = str(tmp_path / "exclusions.npy")
+    update_exclusion_set(path, ["EPI_ISL_30", "EPI_ISL_4"])
+    assert update_exclusion_set(path, ["EPI_ISL_12", "EPI_ISL_4"]).tolist() == [4, 12, 30]
+    assert np.load(path).tolist() == [4, 12, 30]
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Checks of the incremental mode (--incremental <weight store>): a run with the weight store of an earlier run only scores
+# the sequences that are new or whose AA Substitutions changed, and its results are the same as those of a full run.
+#
+# To Run:
+# python -m pytest tests/
+
+from scoring_inputs import METADATA_ROWS, write_inputs, run_month, assert_same_results
+import scoring_engine
+from metadata_reader import readable_accession_ids
+
+def scored_accession_ids(monkeypatch):
+    # Records the accession ids of the sequences that are scored (their weights are broadcast from the scored profiles)
+    scored = []
+    broadcast_profile_weights = scoring_engine.broadcast_profile_weights
+    def recording_broadcast(profile_weights, profile_codes, accession_ids):
+        scored.extend(readable_accession_ids(accession_ids))
+        return (broadcast_profile_weights(profile_weights, profile_codes, accession_ids))
+    monkeypatch.setattr(scoring_engine, "broadcast_profile_weights", recording_broadcast)
+    return (scored)
+
+def test_incremental_run_only_scores_new_sequences(tmp_path, monkeypatch):
+    store = str(tmp_path / "store")
+    # The first run does not have EPI_ISL_7 yet and EPI_ISL_2 has fewer substitutions
+    earlier_rows = [row if row[0] != "EPI_ISL_2" else row[:5] + ("(Spike_E484K)",) for row in METADATA_ROWS if row[0] != "EPI_ISL_7"]
+    write_inputs(tmp_path, earlier_rows)
+    scored = scored_accession_ids(monkeypatch)
+    run_month(tmp_path, "first", ["--incremental", store])
+    assert sorted(scored) == ["EPI_ISL_1", "EPI_ISL_2", "EPI_ISL_3", "EPI_ISL_4", "EPI_ISL_5", "EPI_ISL_6"]
+
+    write_inputs(tmp_path)
+    del scored[:]
+    second = run_month(tmp_path, "second", ["--incremental", store])
+    # Only the new sequence and the sequence with changed AA Substitutions are scored again
+    assert sorted(scored) == ["EPI_ISL_2", "EPI_ISL_7"]
+    del scored[:]
+    third = run_month(tmp_path, "third", ["--incremental", store])
+    assert scored == []
+
+    full = run_month(tmp_path, "full")
+    assert_same_results(second, full)
+    assert_same_results(third, full)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Checks of the parallel mode (--jobs <number of worker processes>): the results of all scoring strategies are the same as
+# those of a serial run, and a run that fails stops its workers and releases the shared weight tables.
+#
+# To Run:
+# python -m pytest tests/
+
+import os
+import filecmp
+import pytest
+from scoring_inputs import run_month
+import scoring_engine
+import mutation_matrix
+
+ALL_STRATEGIES = list(scoring_engine.STRATEGIES)
+
+def output_files(directory):
+    # Returns the paths (relative to the directory) of all files in the directory and its sub directories
+    return (sorted(os.path.relpath(os.path.join(root, file_name), directory) for root, _, file_names in os.walk(directory) for file_name in file_names))
+
+@pytest.mark.parametrize("extra_arguments", [[], ["--months", "2024-08:2024-09"]])
+def test_parallel_run_matches_serial_run(tmp_path, monkeypatch, extra_arguments):
+    # Small reduction blocks, so that the lineage and cube aggregates are also split over the workers
+    monkeypatch.setattr(mutation_matrix, "REDUCTION_BLOCK_ROWS", 3)
+    serial = run_month(tmp_path, "serial", extra_arguments + ["--cube", str(tmp_path / "serial_cube")], strategy_names = ALL_STRATEGIES)
+    parallel = run_month(tmp_path, "parallel", extra_arguments + ["--cube", str(tmp_path / "parallel_cube"), "--jobs", "2"], strategy_names = ALL_STRATEGIES)
+    for expected, result in [(serial, parallel), (tmp_path / "serial_cube", tmp_path / "parallel_cube")]:
+        files = output_files(expected)
+        assert len(files) > 0 and files == output_files(result)
+        for file_name in files:
+            assert filecmp.cmp(os.path.join(expected, file_name), os.path.join(result, file_name), shallow = False), file_name
+
+def test_failed_parallel_run_stops_the_workers(tmp_path, monkeypatch):
+    pools = []
+    released = []
+    scoring_pool = scoring_engine.scoring_pool
+    release_arrays = scoring_engine.release_arrays
+    def recording_pool(*arguments):
+        pool, shared_tables = scoring_pool(*arguments)
+        pools.append((pool, shared_tables))
+        return (pool, shared_tables)
+    def recording_release(blocks):
+        released.append(blocks)
+        release_arrays(blocks)
+    def failing_write(*arguments, **keywords):
+        raise RuntimeError("the results could not be written")
+    monkeypatch.setattr(scoring_engine, "scoring_pool", recording_pool)
+    monkeypatch.setattr(scoring_engine, "release_arrays", recording_release)
+    monkeypatch.setattr(scoring_engine, "write_month_results", failing_write)
+    with pytest.raises(RuntimeError):
+        run_month(tmp_path, "output", ["--jobs", "2"])
+    pool, shared_tables = pools[0]
+    # The pool does not take tasks anymore and the shared weight tables were released
+    with pytest.raises(ValueError):
+        pool.apply(len, ([],))
+    assert len(shared_tables) > 0 and any(blocks is shared_tables for blocks in released)
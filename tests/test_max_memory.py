@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Checks of the memory budgeted batches (--max-memory <size>): a run whose budget only fits a single row per batch has the
+# same results as a run with the default budget (a single batch for the synthetic metadata).
+#
+# To Run:
+# python -m pytest tests/
+
+import os
+import re
+import filecmp
+import pytest
+from scoring_inputs import run_month
+
+@pytest.mark.parametrize("layout", ["wide", "normalized"])
+def test_batched_run_matches_unbatched_run(tmp_path, capsys, layout):
+    unbatched = run_month(tmp_path, "unbatched", ["--output-layout", layout], strategy_names = ["weights_at_all_sites", "noweights_all_sites"])
+    capsys.readouterr()
+    batched = run_month(tmp_path, "batched", ["--output-layout", layout, "--max-memory", "1"], strategy_names = ["weights_at_all_sites", "noweights_all_sites"])
+    # The profiles are tokenized one per batch
+    batches = [int(number) for number in re.findall(r"number of batches:\s+(\d+)", capsys.readouterr().out)]
+    assert len(batches) > 0 and min(batches) > 1
+    files = sorted(os.path.relpath(os.path.join(root, file_name), unbatched) for root, _, file_names in os.walk(unbatched) for file_name in file_names)
+    assert len(files) > 0
+    for file_name in files:
+        assert filecmp.cmp(os.path.join(unbatched, file_name), os.path.join(batched, file_name), shallow = False), file_name
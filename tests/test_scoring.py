@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Checks of the scoring engine against the per-sequence formula of the original variant_scoring_all_sites.py
+# (sum of the weights of the spike amino acid changes, averaged per pango lineage) on a small synthetic metadata file, and
+# of the --months backfill against single month runs.
+#
+# To Run:
+# python -m pytest tests/
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from scoring_inputs import REPOSITORY, METADATA_ROWS, UNDER_REVIEW, run_month, assert_same_results
+
+def baseline_weight(substitutions, weights):
+    # Sum of the weights of the spike amino acid changes of a sequence, parsed like aa_substitution_filter of the original scripts
+    mutations = [token.split("_")[1] for token in substitutions.split(",") if "_" in token and "Spike" in token]
+    weight = 0.0
+    for mutation in mutations:
+        original = re.findall(r'([a-zA-Z]*)\d*.*', mutation)[0]
+        changed = re.findall(r'\d([a-zA-Z]*)', mutation)[-1]
+        weight += weights.get((original, changed), 0.0)
+    return (weight)
+
+def expected_scores():
+    # Per-sequence weights and lineage scores of the baseline formula (human sequences of 09-2024 that are not under review)
+    table = pd.read_csv(os.path.join(REPOSITORY, "reference", "antigenic_weights.csv"), sep = '\t')
+    weights = {(original, changed): weight for original, changed, weight in table[["Original_aa", "Changed_aa", "Weight"]].itertuples(index = False)}
+    rows = [row for row in METADATA_ROWS if row[3] == "Human" and row[1].startswith("2024-09") and row[0] not in UNDER_REVIEW]
+    sequences = pd.DataFrame({"Accession ID": [row[0] for row in rows], "Location": [row[2] for row in rows], "Pango lineage": [row[4] for row in rows],
+                              "Weight": [baseline_weight(row[5], weights) for row in rows]})
+    return (sequences, sequences.groupby("Pango lineage")["Weight"].mean())
+
+def test_run_scoring_matches_baseline_formula(tmp_path):
+    output = run_month(tmp_path, "output")
+    sequences, lineage_scores = expected_scores()
+    scores = pd.read_csv(output / "antigenic_scores_all.csv", sep = '\t').set_index("Accession ID")
+    assert sorted(scores.index) == sorted(sequences["Accession ID"])
+    np.testing.assert_allclose(scores.loc[sequences["Accession ID"], "Weight"].values, sequences["Weight"].values, rtol = 0, atol = 1e-12)
+    ranked = pd.read_csv(output / "antigenic_scores_ranked_with_WHO.csv", sep = '\t').set_index("Pango lineage")
+    np.testing.assert_allclose(ranked.loc[lineage_scores.index, "antigenic_score"].values, lineage_scores.values, rtol = 0, atol = 1e-12)
+    # Country score: lineage antigenic scores weighted by the lineage frequency in the country (without the lineage None)
+    sequences = sequences[sequences["Pango lineage"] != "None"].assign(Country = lambda frame: frame["Location"].str.split("/").str[1].str.strip())
+    frequencies = sequences.groupby(["Country", "Pango lineage"]).size() / sequences.groupby("Country").size()
+    country_scores = (frequencies * lineage_scores.reindex(frequencies.index.get_level_values(1)).values).groupby(level = 0).sum()
+    map_df = pd.read_csv(output / "antigenic_scores_map_visualization.csv", sep = '\t').set_index("Country")
+    np.testing.assert_allclose(map_df.loc[country_scores.index, "country_score"].values, country_scores.values, rtol = 0, atol = 1e-12)
+
+def test_months_backfill_matches_single_month_runs(tmp_path):
+    # The backfill writes the results of every month to its MM-YYYY directory, the same as a run of only that month
+    backfill = run_month(tmp_path, "backfill", ["--months", "2024-07:2024-09"])
+    assert sorted(os.listdir(backfill)) == ["08-2024", "09-2024"]
+    for month in ["08", "09"]:
+        single = run_month(tmp_path, "single_" + month, month = month)
+        assert_same_results(backfill / (month + "-2024"), single)
+        assert (backfill / (month + "-2024") / "month_vis.txt").read_text() == (single / "month_vis.txt").read_text()
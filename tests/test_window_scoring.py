@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Checks of the sliding window scores: the running (prefix) sums of the daily aggregates and the lineage and country
+# scores of window_scoring.py on a small synthetic cube against brute force sums over the days of every window.
+#
+# To Run:
+# python -m pytest tests/
+
+import os
+import sys
+import subprocess
+import numpy as np
+import pandas as pd
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(REPOSITORY, "software"))
+from aggregate_cube import cube_days, prefix_sums, write_cube
+
+LOCATIONS = ["Europe / Germany / Berlin", "Europe / France / Paris", "Asia / China"]
+LINEAGES = ["BA.2", "JN.1", "KP.2", "None"]
+
+def test_window_sums_match_brute_force():
+    random = np.random.default_rng(1)
+    dates = pd.date_range("2024-08-01", "2024-09-30").strftime("%Y-%m-%d")
+    collection_dates = np.append(random.choice(dates, 500), ["2024-09", "2024"])
+    groups = random.integers(-1, 5, len(collection_dates))
+    values = random.random(len(collection_dates))
+    days = cube_days(collection_dates)
+    assert (days[-2:] == -1).all()
+    first_day = int(cube_days(["2024-08-10"])[0])
+    n_days = 40
+    prefix = prefix_sums(days, groups, values, first_day, n_days, 5)
+    for start, stop in [(0, 7), (5, 19), (12, 40), (39, 40)]:
+        inside = (days >= first_day + start) & (days < first_day + stop)
+        expected = [values[inside & (groups == group)].sum() for group in range(5)]
+        np.testing.assert_allclose(prefix[stop] - prefix[start], expected, rtol = 0, atol = 1e-12)
+
+def synthetic_cube():
+    # Cube entries of random days of 08-2024 and 09-2024 (and a partial date that is in no window)
+    random = np.random.default_rng(2)
+    keys = pd.MultiIndex.from_product([pd.date_range("2024-08-01", "2024-09-30").strftime("%Y-%m-%d"), LOCATIONS, LINEAGES]).to_frame(index = False)
+    cube = keys.sample(300, random_state = 3).reset_index(drop = True)
+    cube.columns = ["Collection date", "Location", "Pango lineage"]
+    cube.loc[0, "Collection date"] = "2024-09"
+    cube["sequences"] = random.integers(1, 5, len(cube))
+    cube["weight_sum"] = cube["sequences"] * random.random(len(cube)) * 10
+    cube["weight_sumsq"] = cube["weight_sum"] ** 2
+    return (cube)
+
+def expected_window(cube, first, last):
+    # Lineage and country scores of the cube entries with a collection date from first to last (brute force)
+    dates = pd.to_datetime(cube["Collection date"].where(cube["Collection date"].str.len() == 10))
+    window = cube[(dates >= first) & (dates <= last)].assign(Country = lambda frame: frame["Location"].str.split("/").str[1].str.strip())
+    lineages = window.groupby("Pango lineage")[["sequences", "weight_sum"]].sum()
+    lineage_scores = lineages["weight_sum"] / lineages["sequences"]
+    window = window[window["Pango lineage"] != "None"]
+    frequencies = window.groupby(["Country", "Pango lineage"])["sequences"].sum() / window.groupby("Country")["sequences"].sum()
+    country_scores = (frequencies * lineage_scores.reindex(frequencies.index.get_level_values(1)).values).groupby(level = 0).sum()
+    return (lineage_scores, country_scores)
+
+def test_window_scoring_matches_brute_force(tmp_path):
+    cube = synthetic_cube()
+    write_cube(cube, str(tmp_path / "cube" / "weights_at_all_sites"), "test")
+    output = tmp_path / "windows"
+    subprocess.run([sys.executable, os.path.join(REPOSITORY, "software", "window_scoring.py"), str(tmp_path / "cube" / "weights_at_all_sites"),
+                    os.path.join(REPOSITORY, "reference", "known_variants_of_concern.csv"), str(output), "2024-09-28", "--windows", "7,14",
+                    "--history", "3", "--locations", str(tmp_path / "location_codes.tsv")], check = True, capture_output = True)
+    rolling = pd.read_csv(output / "antigenic_scores_rolling.csv", sep = '\t')
+    rolling_countries = pd.read_csv(output / "antigenic_scores_rolling_countries.csv", sep = '\t')
+    for window in [7, 14]:
+        last = pd.Timestamp("2024-09-28")
+        lineage_scores, country_scores = expected_window(cube, last - pd.Timedelta(days = window - 1), last)
+        ranked = pd.read_csv(output / ("window_" + str(window) + "d") / "antigenic_scores_ranked_with_WHO.csv", sep = '\t').set_index("Pango lineage")
+        assert sorted(ranked.index) == sorted(lineage_scores.index)
+        np.testing.assert_allclose(ranked.loc[lineage_scores.index, "antigenic_score"].values, lineage_scores.values, rtol = 0, atol = 1e-9)
+        map_df = pd.read_csv(output / ("window_" + str(window) + "d") / "antigenic_scores_map_visualization.csv", sep = '\t').set_index("Country")
+        np.testing.assert_allclose(map_df.loc[country_scores.index, "country_score"].values, country_scores.values, rtol = 0, atol = 1e-9)
+        # Rolling scores of the windows that end on each of the last 3 days
+        for last in pd.date_range("2024-09-26", "2024-09-28"):
+            lineage_scores, country_scores = expected_window(cube, last - pd.Timedelta(days = window - 1), last)
+            day_rows = rolling[(rolling["Date"] == last.strftime("%Y-%m-%d")) & (rolling["window"] == window)].set_index("Pango lineage")
+            np.testing.assert_allclose(day_rows.loc[lineage_scores.index, "antigenic_score"].values, lineage_scores.values, rtol = 0, atol = 1e-9)
+            day_rows = rolling_countries[(rolling_countries["Date"] == last.strftime("%Y-%m-%d")) & (rolling_countries["window"] == window)].set_index("Country")
+            np.testing.assert_allclose(day_rows.loc[country_scores.index, "country_score"].values, country_scores.values, rtol = 0, atol = 1e-9)
@@ -13,10 +13,19 @@ function usage () {
         echo
 	echo '-o / --o : desired directory for the output files'
 	echo '-i / --i : desired input file, this is the GISAID metadata file that includes global patient sequences and amino acid changes in the spike protein for those sequences'
+	echo '           either the metadata file itself (metadata.tsv, or compressed as .tar.xz, .xz, .gz, .zst) or a directory containing it (or a partitioned dataset from metadata_partition.py)'
 	echo '-v / --v : path to Corona_Variant_Scoring directory (../Corona_Variant_Scoring/)'
 	echo '-f / --f : path to frequencies data (output of SD plot analysis)'
 	echo '-m / --m : path to month text file which contains a list of months used to determine current month for the heatmap visualization'
 	echo '-u / --u : path to the under investigation sequences csv, this is a list of accession ids that are currently under review from GISAID, they will be removed prior to analysis'
+	echo '-s / --s : (optional) path to a weight store directory, the per-sequence weights of the previous run are reused and only new or changed sequences are scored'
+	echo '-b / --b : (optional) memory budget of the analysis batches, ie. 4G or 512M (default 1G)'
+	echo '-j / --j : (optional) number of worker processes used for the scoring (default 1)'
+	echo '-x / --x : (optional) path to an exclusion set file, the sequences under review of every run are added to it and all of them are removed prior to analysis'
+	echo '-p / --p : (optional) format of the per-sequence scores, parquet (antigenic_scores_all.parquet, default) or tsv (antigenic_scores_all.csv)'
+	echo '-l / --l : (optional) layout of the per-sequence scores, wide (default) or normalized (the distinct profiles, lineages and locations in their own tables)'
+	echo '-c / --c : (optional) path to an aggregate cube directory, the daily lineage counts and weight sums per location of every run are added to it'
+	echo '-r / --r : (optional) path to the directory of the monthly stores of the country scores and threshold countries (default the output/ directory of -o)'
 	echo
 }
 
@@ -26,7 +35,7 @@ if [ "$#" == 0 ]; then
 	echo
 	exit
 else
-	while getopts 'o:i:v:f:m:u:h:q:w:' OPTION; do
+	while getopts 'o:i:v:f:m:u:s:b:j:x:p:l:c:r:h:q:w:' OPTION; do
 		case "${OPTION}" in
 			h) usage; exit ;;
 			o)
@@ -39,8 +48,10 @@ else
 			i)
 				if [ -d "${OPTARG}" ]; then
 					INDIR="${OPTARG}/"
+				elif [ -f "${OPTARG}" ]; then
+					METADATA=${OPTARG}
 				else
-					echo "Please provide a valid input directory, see -h for additional information"; exit
+					echo "Please provide a valid input directory or metadata file, see -h for additional information"; exit
 				fi
 				;;
 			v)
@@ -72,6 +83,30 @@ else
 					echo "Please provide a path to the sequences under review file, see -h for additional information"; exit
 				fi
 				;;
+			s) # Optional weight store for incremental scoring
+				INCREMENTAL=(--incremental "${OPTARG}")
+				;;
+			b) # Optional memory budget of the analysis batches
+				MAXMEMORY=(--max-memory "${OPTARG}")
+				;;
+			j) # Optional number of worker processes
+				JOBS=(--jobs "${OPTARG}")
+				;;
+			x) # Optional persistent exclusion set of the sequences under review
+				EXCLUSIONS=(--exclusions "${OPTARG}")
+				;;
+			p) # Optional format of the per-sequence scores (parquet or tsv)
+				OUTPUTFORMAT=${OPTARG}
+				;;
+			l) # Optional layout of the per-sequence scores (wide or normalized)
+				OUTPUTLAYOUT=${OPTARG}
+				;;
+			c) # Optional daily aggregate cube directory
+				CUBE=(--cube "${OPTARG}")
+				;;
+			r) # Optional directory of the monthly stores (global map and country-wise plot)
+				STOREDIR=${OPTARG}
+				;;
 			q) # Month input required for the variant_scoring.py script should, used for selecting specific months for analysis (ie months comparison)
 				MONTH=${OPTARG}
 				;;
@@ -85,26 +120,46 @@ else
 	done
 fi
 
+# Locating the metadata in the input directory, compressed snapshots are decompressed on the fly by the scoring scripts
+if [ -z "$METADATA" ]; then
+	if ls -d "$INDIR"collection_month=* > /dev/null 2>&1; then METADATA="$INDIR"
+	else
+		for CANDIDATE in metadata.tsv metadata_tsv.tar.xz metadata.tar.xz metadata.tsv.xz metadata.tsv.gz metadata.tsv.zst; do
+			if [ -f "$INDIR""$CANDIDATE" ]; then METADATA="$INDIR""$CANDIDATE"; break; fi
+		done
+	fi
+	if [ -z "$METADATA" ]; then echo "No metadata file found in $INDIR, see -h for additional information"; exit; fi
+fi
+
+# The per-sequence scores are written as parquet unless the tsv output is requested
+OUTPUTFORMAT=${OUTPUTFORMAT:-parquet}
+if [ "$OUTPUTFORMAT" == "tsv" ]; then SCORESEXTENSION=".csv"; else SCORESEXTENSION=".parquet"; fi
+# In the normalized layout the heatmap scripts are given the per-sequence table, the other tables are found next to it
+OUTPUTLAYOUT=${OUTPUTLAYOUT:-wide}
+if [ "$OUTPUTLAYOUT" == "normalized" ]; then SCORESFILE="antigenic_scores_all_sequences""$SCORESEXTENSION"; else SCORESFILE="antigenic_scores_all""$SCORESEXTENSION"; fi
+
 #----------
 # Analysis
 #----------
 
 # Creating an ouput directory if one has not been created already
 if [ ! -d "$OUTDIR"'output/' ]; then mkdir "$OUTDIR"'output/'; fi
+# The monthly stores are kept in the output directory unless -r is given, the reference directory is only read
+STOREDIR=${STOREDIR:-"$OUTDIR""output/"}
 
 # Running Variant Scoring Analysis and Visualization
 echo "Running Variant Scoring Analysis and Visualization"
 # Antigenic Scoring Analysis
-python "$SOFTWAREPATH""variant_scoring_all_sites.py" "$INDIR""metadata.tsv" "$AntigenicScoring""reference/tp_sites.csv" "$OUTDIR""output/" "$AntigenicScoring""reference/antigenic_weights.csv" "$AntigenicScoring""reference/known_variants_of_concern.csv" "$SEQUI" "$MONTH" "$YEAR"> "$OUTDIR""STDOUT.txt" # month (including 0 before value if < 10 (ex. 07 for july) # year
+python "$SOFTWAREPATH""variant_scoring_all_sites.py" "$METADATA" "$AntigenicScoring""reference/tp_sites.csv" "$OUTDIR""output/" "$AntigenicScoring""reference/antigenic_weights.csv" "$AntigenicScoring""reference/known_variants_of_concern.csv" "$SEQUI" "$MONTH" "$YEAR" "${INCREMENTAL[@]}" "${MAXMEMORY[@]}" "${JOBS[@]}" "${EXCLUSIONS[@]}" "${CUBE[@]}" --output-format "$OUTPUTFORMAT" --output-layout "$OUTPUTLAYOUT" > "$OUTDIR""STDOUT.txt" # month (including 0 before value if < 10 (ex. 07 for july) # year
 
 # Frequency Heatmap
 echo "Creating Frequency Heatmap"
 if [ -f "$OUTDIR"'output/month_remove.txt' ]; then grep -Fvxf "$OUTDIR"'output/month_remove.txt' "$MONTHS" > "$OUTDIR"'output/month_corrected.txt'; MONTHS="$OUTDIR"'output/month_corrected.txt'; fi
-#Rscript "$SOFTWAREPATH""frequency_heatmap.R" "$FREQUENCY" "$OUTDIR""output/antigenic_scores_ranked_with_WHO.csv" "$MONTHS" "0.1" "$OUTDIR""output/" "$OUTDIR""output/antigenic_scores_all.csv"
-Rscript "$SOFTWAREPATH""frequency_heatmap_coverage.R" "$FREQUENCY" "$OUTDIR""output/antigenic_scores_ranked_with_WHO.csv" "$MONTHS" "0.1" "$OUTDIR""output/" "$OUTDIR""output/antigenic_scores_all.csv" >> "$OUTDIR""STDOUT.txt"
+#Rscript "$SOFTWAREPATH""frequency_heatmap.R" "$FREQUENCY" "$OUTDIR""output/antigenic_scores_ranked_with_WHO.csv" "$MONTHS" "0.1" "$OUTDIR""output/" "$OUTDIR""output/$SCORESFILE" "$AntigenicScoring""reference/location_codes.tsv"
+Rscript "$SOFTWAREPATH""frequency_heatmap_coverage.R" "$FREQUENCY" "$OUTDIR""output/antigenic_scores_ranked_with_WHO.csv" "$MONTHS" "0.1" "$OUTDIR""output/" "$OUTDIR""output/$SCORESFILE" "$AntigenicScoring""reference/location_codes.tsv" >> "$OUTDIR""STDOUT.txt"
 
 # Global Map of Antigenic Scores
 echo "Creating Global Map"
-python "$SOFTWAREPATH""global_scoring_map.py" "$OUTDIR""output/antigenic_scores_map_visualization.csv" "$OUTDIR""output/" "$OUTDIR""output/month_vis.txt" "$AntigenicScoring""reference/" >> "$OUTDIR""STDOUT.txt"
+python "$SOFTWAREPATH""global_scoring_map.py" "$OUTDIR""output/antigenic_scores_map_visualization.csv" "$OUTDIR""output/" "$OUTDIR""output/month_vis.txt" "$AntigenicScoring""reference/" --store "$STOREDIR" >> "$OUTDIR""STDOUT.txt"
 
 echo "COMPLETE"